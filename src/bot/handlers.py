@@ -1,31 +1,60 @@
 import uuid
 from src.utils.config import load_config
 from src.utils.logging_config import logger
+from src.utils.startup_metrics import record_startup_event
 from src.utils.exceptions import SlackAPIError, SDSlackBotError
 from src.queue.request_queue import request_queue
+from src.stats.reporter import PERIODS, generate_report_message
+from src.utils.reference_store import reference_store
+from src.image_generation.output_retention import output_retention
 from .views import open_image_gen_modal, open_remix_modal
+from .status_updates import status_updater
+from .slack_dispatcher import slack_dispatcher
 
 config = load_config()
 
 def register_handlers(app):
     @app.command("/generate_image")
-    async def start_image_generation(ack, body, client):
+    async def start_image_generation(ack, body):
         await ack()
+        record_startup_event('first_ack')
         try:
-            await open_image_gen_modal(client, body["trigger_id"], body["channel_id"])
+            await open_image_gen_modal(body["trigger_id"], body["channel_id"])
         except Exception as e:
             logger.error(f"Error opening modal: {str(e)}")
             raise SlackAPIError(f"Failed to open image generation modal: {str(e)}")
 
+    @app.command("/stats")
+    async def show_stats(ack, body):
+        await ack()
+        record_startup_event('first_ack')
+        user_id = body["user_id"]
+        period = (body.get("text") or "daily").strip().lower()
+
+        try:
+            if period not in PERIODS:
+                raise SDSlackBotError(f"Unknown period '{period}'. Use one of: {', '.join(PERIODS)}")
+            message = await generate_report_message(period)
+            await slack_dispatcher.call('chat_postMessage', channel=user_id, text=message)
+        except Exception as e:
+            logger.error(f"Error handling stats command: {str(e)}")
+            await slack_dispatcher.call(
+                'chat_postMessage',
+                channel=user_id,
+                text=f"An error occurred while fetching stats: {str(e)}"
+            )
+
     @app.action("regenerate_image")
-    async def handle_regenerate(ack, body, client):
+    async def handle_regenerate(ack, body):
         await ack()
+        record_startup_event('first_ack')
         user_id = body["user"]["id"]
         request_id = body["actions"][0]["value"].split("_")[1]
 
         try:
             # Fetch original request details
-            original_request = await request_queue.get_request_by_id(request_id)
+            original_request = (await request_queue.get_request_by_id(request_id)
+                                or await output_retention.find_request(request_id))
             if not original_request:
                 raise SDSlackBotError("Original request not found")
 
@@ -38,41 +67,48 @@ def register_handlers(app):
                 'params': original_request['params']
             }
 
-            # Add new request to queue
+            # Add new request to queue, keeping its reference image alive until it completes
+            reference_store.acquire(new_request['params']['reference_image_path'])
             queue_position = await request_queue.add_request(new_request)
 
-            # Send message about queued regeneration
-            await client.chat_postMessage(
-                channel=user_id,
-                text=f"Your image regeneration request has been queued. You are number {queue_position} in line. "
-                     f"Estimated wait time: {request_queue.estimate_wait_time(queue_position)} seconds."
+            # Send message about queued regeneration; it is edited in place as the queue moves
+            estimated_time = request_queue.estimate_wait_time(queue_position)
+            status_text = (f"Your image regeneration request has been queued. You are number {queue_position} in line. "
+                           f"Estimated wait time: {estimated_time} seconds.")
+            response = await slack_dispatcher.call('chat_postMessage', channel=user_id, text=status_text)
+            status_updater.track(
+                new_request_id, response['channel'], response['ts'], status_text, queue_position, estimated_time
             )
 
         except Exception as e:
             logger.error(f"Error handling regenerate action: {str(e)}")
-            await client.chat_postMessage(
+            await slack_dispatcher.call(
+                'chat_postMessage',
                 channel=user_id,
                 text=f"An error occurred while processing your regeneration request: {str(e)}"
             )
 
     @app.action("remix_image")
-    async def handle_remix(ack, body, client):
+    async def handle_remix(ack, body):
         await ack()
+        record_startup_event('first_ack')
         user_id = body["user"]["id"]
         request_id = body["actions"][0]["value"].split("_")[1]
 
         try:
             # Fetch original request details
-            original_request = await request_queue.get_request_by_id(request_id)
+            original_request = (await request_queue.get_request_by_id(request_id)
+                                or await output_retention.find_request(request_id))
             if not original_request:
                 raise SDSlackBotError("Original request not found")
 
             # Open remix modal
-            await open_remix_modal(client, body["trigger_id"], original_request['params'])
+            await open_remix_modal(body["trigger_id"], original_request['params'])
 
         except Exception as e:
             logger.error(f"Error handling remix action: {str(e)}")
-            await client.chat_postMessage(
+            await slack_dispatcher.call(
+                'chat_postMessage',
                 channel=user_id,
                 text=f"An error occurred while processing your remix request: {str(e)}"
             )
@@ -1,34 +1,111 @@
 import asyncio
-import os
+from concurrent.futures import ThreadPoolExecutor
 from src.utils.logging_config import logger
 from src.utils.exceptions import SDSlackBotError
 from src.queue.request_queue import request_queue
-from src.image_generation.sd_wrapper import generate_image
-from src.utils.file_handling import get_latest_file
+from src.utils.config import load_config
+from src.image_generation.backend import backend
+from src.image_generation.model_cache import model_cache
+from src.image_generation.encoding import output_encoder
+from src.image_generation.output_retention import output_retention
+from src.stats.tracker import stats_recorder
+from src.utils.reference_store import reference_store
+from .status_updates import status_updater
+from .slack_dispatcher import slack_dispatcher, PRIORITY_DELIVERY
+
+config = load_config()
+
+class GenerationWorker:
+    """One generation slot, optionally pinned to a torch device and/or a set of model styles."""
+
+    def __init__(self, worker_id, device=None, models=None):
+        self.worker_id = worker_id
+        self.device = device
+        self.models = set(models) if models else None
+        # A dedicated thread keeps the worker's CUDA device and ComfyUI state on one thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"generation-{worker_id}")
+
+async def process_queue(worker):
+    # Requests keep queueing (and their position messages stay live) while the backend loads,
+    # but shutdown must not wait for the import and warmup to finish
+    settled = asyncio.ensure_future(backend.wait_settled())
+    closed = asyncio.ensure_future(request_queue.wait_closed())
+    try:
+        await asyncio.wait({settled, closed}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        settled.cancel()
+        closed.cancel()
+    if request_queue.closed:
+        return
 
-async def process_queue(client):
     while True:
-        request = await request_queue.get_next_request()
-        if request is None:
-            await asyncio.sleep(1)  # Wait a bit before checking again
-            continue
-
-        await process_image_request(client, request)
-
-        # Update queue positions for remaining requests
-        for i, queued_request in enumerate(request_queue.queue):
-            await send_queue_update(client, queued_request['user_id'], i + 1)
-
-async def process_image_request(client, request):
+        # Read per batch so edits to the config file apply without a restart
+        max_batch_size = config['queue'].get('max_batch_size', 1)
+        batch_wait_seconds = config['queue'].get('batch_wait_seconds', 0)
+        request_queue.set_loaded_models(model_cache.resident_styles())
+        batch = await request_queue.get_next_batch(max_batch_size, batch_wait_seconds, worker.models)
+        if not batch:
+            # The queue was closed for shutdown
+            break
+
+        logger.info(f"Worker {worker.worker_id} picked up a batch of {len(batch)}")
+        # Everyone behind this batch just moved up
+        status_updater.schedule_refresh()
+        await asyncio.gather(*(
+            status_updater.set_status(request['id'], "Your image is being generated now.")
+            for request in batch
+        ))
+
+        try:
+            await process_batch(batch, worker)
+        except Exception:
+            # A failed batch must never take the worker down with it
+            logger.exception(f"Worker {worker.worker_id} failed to process a batch of {len(batch)}")
+        request_queue.set_loaded_models(model_cache.resident_styles())
+        status_updater.schedule_refresh()
+
+async def process_batch(batch, worker):
     try:
-        output_path = await generate_image(**request['params'])
+        try:
+            images = await backend.generate_images(
+                [request['params'] for request in batch],
+                device=worker.device,
+                executor=worker.executor,
+            )
+        except Exception as e:
+            logger.error(f"Error generating batch of {len(batch)}: {str(e)}", exc_info=True)
+            await asyncio.gather(*(notify_failure(request, e) for request in batch))
+            return
+
+        await asyncio.gather(*(
+            deliver_image(request, image)
+            for request, image in zip(batch, images)
+        ))
+    finally:
+        await request_queue.complete_requests(batch)
+        for request in batch:
+            reference_store.release(request['params']['reference_image_path'])
 
-        # Get the directory and filename prefix
-        output_dir = os.path.dirname(output_path)
-        filename_prefix = os.path.basename(output_path).split('.')[0]  # Remove the extension
+async def notify_failure(request, error):
+    try:
+        await status_updater.set_status(request['id'], "Your image generation request failed.", final=True)
+        await slack_dispatcher.call(
+            'chat_postMessage',
+            channel=request['user_id'],
+            text=f"An error occurred while generating your image: {str(error)}"
+        )
+    except Exception as e:
+        logger.error(f"Failed to notify user of failed request {request['id']}: {str(e)}")
 
-        # Get the actual file path
-        actual_file_path = get_latest_file(output_dir, filename_prefix)
+async def deliver_image(request, image):
+    try:
+        # Encode the compact delivery copy off the event loop; the upload streams from memory
+        name = f"ComfyUI_{request['params']['model_style']}_{request['id']}"
+        # The archival copy is indexed for retention and for Regenerate/Remix of older images
+        encoded = await output_encoder.encode_image(
+            image, name, on_archived=lambda path, size: output_retention.record(request, path, size)
+        )
+        logger.info(f"Request {request['id']} encoded for delivery: {encoded.describe()}")
 
         # Prepare the message text with metadata
         message_text = (
@@ -60,73 +137,95 @@ async def process_image_request(client, request):
             }
         ]
 
-        # Open a DM channel with the user
-        dm_channel = await client.conversations_open(users=request['user_id'])
-        dm_channel_id = dm_channel['channel']['id']
+        # Open a DM channel with the user (cached by the dispatcher)
+        dm_channel_id = await slack_dispatcher.open_dm(request['user_id'])
 
-        # Upload image file to DM with all information
-        dm_upload_result = await client.files_upload_v2(
+        # Upload the image to the DM first, so the requester gets it even if the channel share fails
+        await slack_dispatcher.call(
+            'files_upload_v2',
+            priority=PRIORITY_DELIVERY,
             channel=dm_channel_id,
-            file=actual_file_path,
+            content=encoded.data,
+            filename=encoded.filename,
             initial_comment=message_text
         )
 
-        # Send the button message to DM
-        await client.chat_postMessage(
-            channel=dm_channel_id,
-            text="Actions:",
-            blocks=button_blocks
-        )
+        # The DM buttons and the channel share don't depend on each other
+        deliveries = [post_actions(dm_channel_id, button_blocks)]
 
-        # Send to original channel if different from DM and is a valid channel ID
+        # Share to original channel if different from DM and is a valid channel ID
         original_channel = request.get('channel')
         if original_channel and original_channel != dm_channel_id and original_channel.startswith(('C', 'G')):
-            try:
-                # Upload the file to the original channel
-                await client.files_upload_v2(
-                    channel=original_channel,
-                    file=actual_file_path,
-                    initial_comment=message_text
-                )
-
-                # Send the button message to the original channel
-                await client.chat_postMessage(
-                    channel=original_channel,
-                    text="Actions:",
-                    blocks=button_blocks
-                )
-            except Exception as channel_upload_error:
-                logger.error(f"Failed to upload file to channel {original_channel}: {str(channel_upload_error)}")
-                # If file upload fails, send a message with the file link instead
-                file_link = dm_upload_result['file']['permalink']
-                await client.chat_postMessage(
-                    channel=original_channel,
-                    text=f"{message_text}\n\nYou can view the image here: {file_link}"
-                )
-                await client.chat_postMessage(
-                    channel=original_channel,
-                    text="Actions:",
-                    blocks=button_blocks
-                )
+            deliveries.append(share_to_channel(original_channel, encoded, message_text, button_blocks))
         elif original_channel and original_channel != dm_channel_id:
-            logger.warning(f"Invalid channel ID: {original_channel}. Skipping channel upload.")
+            logger.warning(f"Invalid channel ID: {original_channel}. Skipping channel share.")
+
+        await asyncio.gather(*deliveries)
+        await status_updater.set_status(request['id'], "Your image has been generated.", final=True)
+        stats_recorder.record_generation_event(
+            request['user_id'], request['params']['model_style'],
+            f"{request['params']['width']}x{request['params']['height']}"
+        )
 
     except Exception as e:
         logger.error(f"Error processing image request: {str(e)}", exc_info=True)
-        await client.chat_postMessage(
-            channel=request['user_id'],
-            text=f"An error occurred while generating your image: {str(e)}"
+        await notify_failure(request, e)
+
+async def share_to_channel(channel, encoded, message_text, button_blocks):
+    # A DM file can't be shared on to a channel, so the channel gets its own upload of the
+    # same encoded bytes. Failing here (e.g. the bot isn't in the channel) doesn't affect the DM.
+    try:
+        await slack_dispatcher.call(
+            'files_upload_v2',
+            priority=PRIORITY_DELIVERY,
+            channel=channel,
+            content=encoded.data,
+            filename=encoded.filename,
+            initial_comment=message_text
         )
-    finally:
-        await request_queue.complete_current_request()
-
-async def send_queue_update(client, user_id, queue_position):
-    estimated_time = request_queue.estimate_wait_time(queue_position)
-    await client.chat_postMessage(
-        channel=user_id,
-        text=f"Your image generation request is now at position {queue_position}. "
-             f"Estimated wait time: {estimated_time} seconds."
+        await post_actions(channel, button_blocks)
+    except Exception as e:
+        logger.warning(f"Failed to share image to channel {channel}: {str(e)}")
+
+async def post_actions(channel, button_blocks):
+    await slack_dispatcher.call(
+        'chat_postMessage',
+        priority=PRIORITY_DELIVERY,
+        channel=channel,
+        text="Actions:",
+        blocks=button_blocks
     )
 
-async def start_queue_processing(client):
-    asyncio.create_task(process_queue(client))
+def create_workers():
+    worker_configs = config['queue'].get('workers') or [{}]
+    return [
+        GenerationWorker(i, device=worker_config.get('device'), models=worker_config.get('models'))
+        for i, worker_config in enumerate(worker_configs)
+    ]
+
+_worker_tasks = []
+_recovered = asyncio.Event()
+
+async def wait_recovered():
+    """Wait until requests recovered from the journal hold their reference images again."""
+    await _recovered.wait()
+
+async def start_queue_processing():
+    recovered = await request_queue.recover()
+    if recovered:
+        logger.info(f"Re-queued {recovered} request(s) that were pending before the restart")
+        for request in request_queue.queued_requests():
+            reference_store.acquire(request['params']['reference_image_path'])
+    _recovered.set()
+
+    workers = create_workers()
+    for worker in workers:
+        _worker_tasks.append(asyncio.create_task(process_queue(worker)))
+    logger.info(f"Started {len(workers)} generation worker(s)")
+
+async def stop_queue_processing():
+    """Close the queue and let the workers finish the batches they are running."""
+    await request_queue.close()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    await request_queue.close_storage()
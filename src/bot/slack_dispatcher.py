@@ -0,0 +1,239 @@
+import time
+import heapq
+import asyncio
+import itertools
+from src.utils.config import load_config
+from src.utils.logging_config import logger
+from src.utils.exceptions import SlackAPIError
+
+config = load_config()
+
+# Lower values are sent first when calls back up
+PRIORITY_INTERACTIVE = 0  # calls bound to a short-lived trigger_id, e.g. views_open
+PRIORITY_DELIVERY = 1  # generated images and their action buttons
+PRIORITY_NOTIFY = 2  # confirmations and error messages
+PRIORITY_STATUS = 3  # queue position edits, the first thing to shed under pressure
+
+# Sustained calls per minute, following Slack's published tiers for each method
+METHOD_RATE_LIMITS = {
+    'chat_postMessage': 60,
+    'chat_update': 50,
+    'conversations_open': 50,
+    'files_info': 100,
+    'files_upload_v2': 20,
+    'files_getUploadURLExternal': 20,
+    'files_completeUploadExternal': 20,
+    'views_open': 100,
+}
+DEFAULT_RATE_LIMIT = 50
+
+class TokenBucket:
+    """Token bucket for one method. Only touched from the event loop, so it needs no lock."""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def delay(self, tokens: int = 1) -> float:
+        """Seconds until ``tokens`` tokens are available, 0 if they already are."""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+class _Call:
+    """A queued Web API call, ordered by priority and then by arrival."""
+
+    __slots__ = ('priority', 'sequence', 'method', 'kwargs', 'future', 'attempt', 'released')
+
+    def __init__(self, priority, sequence, method, kwargs, future):
+        self.priority = priority
+        self.sequence = sequence
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.attempt = 0
+        self.released = False
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+def _retry_after(error):
+    """Seconds to back off if ``error`` is an HTTP 429 from Slack, otherwise None."""
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) != 429:
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', headers.get('retry-after', 1)))
+    except (TypeError, ValueError):
+        return 1.0
+
+class SlackDispatcher:
+    """Single outbound path for Slack Web API calls.
+
+    Calls are queued by priority and executed by a small pool of concurrent
+    senders. Each method is throttled by its own token bucket, and a 429 pauses
+    that method for its Retry-After before retrying. A call whose method is out
+    of tokens or paused is parked with the other calls for that method instead
+    of holding a sender, so a throttled method never delays the others. DM
+    channel ids from ``conversations_open`` are cached per user. Any object
+    exposing the Web API methods as coroutines can be bound as the client.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_retries: int = 3, burst: int = 5):
+        self.client = None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.burst = burst
+        self._queue = None
+        self._senders = []
+        self._buckets = {}
+        self._paused_until = {}
+        self._parked = {}
+        self._wakeups = {}
+        self._dm_channels = {}
+        self._sequence = itertools.count()
+
+    def bind(self, client) -> None:
+        self.client = client
+
+    async def call(self, method: str, priority: int = PRIORITY_NOTIFY, **kwargs):
+        """Queue a Web API call and wait for its response."""
+        if self.client is None:
+            raise SlackAPIError("Slack dispatcher has no client bound")
+        self._ensure_senders()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Call(priority, next(self._sequence), method, kwargs, future))
+        return await future
+
+    async def open_dm(self, user_id: str, priority: int = PRIORITY_DELIVERY) -> str:
+        # Concurrent callers for the same user share one conversations_open
+        lookup = self._dm_channels.get(user_id)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self.call('conversations_open', priority=priority, users=user_id))
+            self._dm_channels[user_id] = lookup
+        try:
+            response = await asyncio.shield(lookup)
+        except Exception:
+            if self._dm_channels.get(user_id) is lookup:
+                del self._dm_channels[user_id]
+            raise
+        return response['channel']['id']
+
+    async def close(self) -> None:
+        for sender in self._senders:
+            sender.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        for wakeup in self._wakeups.values():
+            wakeup.cancel()
+        # Nothing will send what is still queued or parked; don't leave its callers hanging
+        pending = [call for parked in self._parked.values() for call in parked]
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for call in pending:
+            call.future.cancel()
+        self._senders = []
+        self._queue = None
+        self._parked = {}
+        self._wakeups = {}
+
+    def _ensure_senders(self) -> None:
+        if self._senders:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._senders = [asyncio.create_task(self._send_loop()) for _ in range(self.max_concurrency)]
+
+    async def _send_loop(self) -> None:
+        while True:
+            call = await self._queue.get()
+            if call.future.done():
+                continue
+            # Keep behind calls already waiting on this method, and don't hold a sender while throttled
+            if self._parked.get(call.method) and not call.released:
+                self._park(call)
+                continue
+            call.released = False
+            delay = self._delay(call.method)
+            if delay > 0:
+                self._park(call, delay)
+                continue
+
+            self._bucket(call.method).take()
+            try:
+                result = await getattr(self.client, call.method)(**call.kwargs)
+            except asyncio.CancelledError:
+                if not call.future.done():
+                    call.future.cancel()
+                raise
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is not None and call.attempt < self.max_retries:
+                    call.attempt += 1
+                    logger.warning(f"Slack rate limited {call.method}, retrying in {retry_after}s "
+                                   f"(attempt {call.attempt}/{self.max_retries})")
+                    self._paused_until[call.method] = time.monotonic() + retry_after
+                    self._park(call, retry_after)
+                elif not call.future.done():
+                    call.future.set_exception(e)
+                continue
+            if not call.future.done():
+                call.future.set_result(result)
+
+    def _delay(self, method: str) -> float:
+        pause = self._paused_until.get(method, 0) - time.monotonic()
+        return max(pause, self._bucket(method).delay())
+
+    def _park(self, call: _Call, delay: float = None) -> None:
+        heapq.heappush(self._parked.setdefault(call.method, []), call)
+        if call.method not in self._wakeups:
+            if delay is None:
+                delay = self._delay(call.method)
+            self._schedule_release(call.method, delay)
+
+    def _schedule_release(self, method: str, delay: float) -> None:
+        self._wakeups[method] = asyncio.get_running_loop().call_later(delay, self._release, method)
+
+    def _release(self, method: str) -> None:
+        """Move as many parked calls for ``method`` back to the queue as it has tokens for."""
+        self._wakeups.pop(method, None)
+        parked = self._parked.get(method)
+        if not parked or self._queue is None:
+            return
+        delay = self._delay(method)
+        if delay > 0:
+            self._schedule_release(method, delay)
+            return
+
+        released = 0
+        tokens = max(1, int(self._bucket(method).tokens))
+        while parked and released < tokens:
+            call = heapq.heappop(parked)
+            if call.future.done():
+                continue
+            call.released = True
+            self._queue.put_nowait(call)
+            released += 1
+        if parked:
+            self._schedule_release(method, self._bucket(method).delay(released + 1))
+        else:
+            del self._parked[method]
+
+    def _bucket(self, method: str) -> TokenBucket:
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            rate = config['slack'].get('rate_limits', {}).get(method) or METHOD_RATE_LIMITS.get(method, DEFAULT_RATE_LIMIT)
+            bucket = TokenBucket(rate, self.burst)
+            self._buckets[method] = bucket
+        return bucket
+
+slack_dispatcher = SlackDispatcher()
@@ -5,11 +5,17 @@ from src.utils.config import load_config
 from src.utils.logging_config import logger
 from .handlers import register_handlers
 from .views import register_views
-from .queue_processor import start_queue_processing
+from .queue_processor import start_queue_processing, stop_queue_processing
+from .slack_dispatcher import slack_dispatcher
+from src.utils.startup_metrics import record_startup_event
+from src.utils.http_client import http_client
 
 config = load_config()
 app = AsyncApp(token=config['slack']['bot_token'])
 
+# Every outbound Web API call goes through the dispatcher
+slack_dispatcher.bind(app.client)
+
 # Register handlers and views
 register_handlers(app)
 register_views(app)
@@ -18,9 +24,17 @@ async def start_bot():
     handler = AsyncSocketModeHandler(app, config['slack']['app_token'])
 
     # Start queue processing
-    await start_queue_processing(app.client)
+    await start_queue_processing()
 
-    await handler.start_async()
+    try:
+        await handler.connect_async()
+        record_startup_event('socket_connected')
+        # Equivalent to start_async(), which connects and then sleeps forever
+        await asyncio.sleep(float("inf"))
+    finally:
+        await stop_queue_processing()
+        await slack_dispatcher.close()
+        await http_client.close()
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,95 @@
+import time
+import asyncio
+from src.utils.config import load_config
+from src.utils.logging_config import logger
+from src.queue.request_queue import request_queue
+from .slack_dispatcher import slack_dispatcher, PRIORITY_STATUS
+
+config = load_config()
+
+def queue_status_text(position, estimated_time):
+    return (f"Your image generation request is now at position {position}. "
+            f"Estimated wait time: {estimated_time} seconds.")
+
+class QueueStatusUpdater:
+    """Keeps one status message per queued request up to date by editing it in place.
+
+    Refreshes are coalesced: any number of ``schedule_refresh()`` calls while one is
+    running result in at most one more pass. A message is only edited when the
+    request's position or ETA changed, and never more often than once per ``min_interval``.
+    Edits go out concurrently at the dispatcher's lowest priority.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.messages = {}
+        self._refresh_task = None
+        self._dirty = False
+
+    def track(self, request_id, channel, ts, text, position, estimated_time):
+        """Register the message posted when a request was queued, and the position and ETA it shows."""
+        self.messages[request_id] = {
+            'channel': channel,
+            'ts': ts,
+            'text': text,
+            'queue_state': (position, estimated_time),
+            'updated_at': time.monotonic(),
+        }
+
+    async def set_status(self, request_id, text, final=False):
+        """Edit a request's status message right away, e.g. when it starts or finishes."""
+        message = self.messages.get(request_id)
+        if final:
+            self.messages.pop(request_id, None)
+        if message is not None and message['text'] != text:
+            await self._edit(message, text)
+
+    def schedule_refresh(self):
+        self._dirty = True
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            self._dirty = False
+            next_due = await self._refresh()
+            if next_due is not None:
+                # Some messages changed too recently; come back for them
+                self._dirty = True
+                await asyncio.sleep(next_due)
+
+    async def _refresh(self):
+        now = time.monotonic()
+        next_due = None
+        edits = []
+        for position, request in enumerate(request_queue.queued_requests(), start=1):
+            message = self.messages.get(request['id'])
+            if message is None:
+                continue
+            # Compare what the message says, not its wording, which differs for the initial post
+            queue_state = (position, request_queue.estimate_wait_time(position))
+            if queue_state == message['queue_state']:
+                continue
+            wait = message['updated_at'] + self.min_interval - now
+            if wait > 0:
+                next_due = wait if next_due is None else min(next_due, wait)
+                continue
+            edits.append(self._edit(message, queue_status_text(*queue_state), queue_state))
+
+        if edits:
+            await asyncio.gather(*edits)
+        return next_due
+
+    async def _edit(self, message, text, queue_state=None):
+        try:
+            await slack_dispatcher.call(
+                'chat_update', priority=PRIORITY_STATUS,
+                channel=message['channel'], ts=message['ts'], text=text
+            )
+            message['text'] = text
+            message['queue_state'] = queue_state
+            message['updated_at'] = time.monotonic()
+        except Exception as e:
+            logger.warning(f"Failed to update status message {message['ts']}: {str(e)}")
+
+status_updater = QueueStatusUpdater(config['queue'].get('status_update_interval', 10))
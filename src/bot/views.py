@@ -1,34 +1,40 @@
-import os
 import uuid
 from src.utils.config import load_config
 from src.utils.logging_config import logger
+from src.utils.startup_metrics import record_startup_event
 from src.utils.exceptions import SDSlackBotError
-from src.utils.file_handling import handle_reference_image, cleanup_temp_dir
+from src.utils.file_handling import handle_reference_image
+from src.utils.reference_store import reference_store
+from src.image_generation.reference_preprocessing import reference_preprocessor
 from src.queue.request_queue import request_queue
+from .status_updates import status_updater
+from .slack_dispatcher import slack_dispatcher, PRIORITY_INTERACTIVE
 
 config = load_config()
 
 def register_views(app):
     @app.view("image_gen_modal")
-    async def handle_submission(ack, body, client, view):
+    async def handle_submission(ack, body, view):
         logger.info("Image generation modal submitted")
         await ack()
+        record_startup_event('first_ack')
         logger.info("Acknowledgement sent, calling process_submission")
-        await process_submission(body, client, view, is_remix=False)
+        await process_submission(body, view, is_remix=False)
         logger.info("process_submission completed for image generation")
 
     @app.view("remix_modal")
-    async def handle_remix_submission(ack, body, client, view):
+    async def handle_remix_submission(ack, body, view):
         logger.info("Remix modal submitted")
         await ack()
+        record_startup_event('first_ack')
         logger.info("Acknowledgement sent, calling process_submission")
-        await process_submission(body, client, view, is_remix=True)
+        await process_submission(body, view, is_remix=True)
         logger.info("process_submission completed for remix")
 
-async def process_submission(body, client, view, is_remix):
+async def process_submission(body, view, is_remix):
     user_id = body["user"]["id"]
     channel_id = body.get("view", {}).get("private_metadata", user_id)
-    temp_dir = None
+    held_reference = None
     logger.info(f"Starting process_submission for user {user_id}, is_remix: {is_remix}")
     try:
         logger.info("Parsing input values")
@@ -52,8 +58,17 @@ async def process_submission(body, client, view, is_remix):
             logger.info(f"Reference image input: {reference_image_input}")
             if reference_image_input.get("files"):
                 logger.info("Reference image file found, processing...")
-                reference_image_path = await handle_reference_image(reference_image_input["files"][0], client)
-                temp_dir = os.path.dirname(reference_image_path)
+                file_id = reference_image_input["files"][0]["id"]
+
+                async def download():
+                    file_obj = await slack_dispatcher.call('files_info', priority=PRIORITY_INTERACTIVE, file=file_id)
+                    return await handle_reference_image(file_obj["file"])
+
+                # Files attached before are served from the store without files_info or a download
+                reference_image_path = await reference_store.fetch(file_id, download)
+                held_reference = reference_image_path
+                # Decode, orient and downscale now, off the generation thread
+                await reference_preprocessor.prepare(reference_image_path)
                 logger.info(f"Reference image processed, path: {reference_image_path}")
             else:
                 logger.info("No reference image uploaded, using default")
@@ -82,29 +97,37 @@ async def process_submission(body, client, view, is_remix):
                 'model_style': model_style
             }
         })
+        # The queued request now owns the reference until it completes
+        held_reference = None
         logger.info(f"Request added to queue at position {queue_position}")
 
-        # Send initial message with queue position
+        # Send initial message with queue position; it is edited in place as the queue moves
         logger.info("Sending queue position message to user")
-        await client.chat_postMessage(
-            channel=user_id,
-            text=f"Your {'remixed ' if is_remix else ''}image generation request has been queued. You are number {queue_position} in line. "
-                 f"Estimated wait time: {request_queue.estimate_wait_time(queue_position)} seconds."
-        )
+        estimated_time = request_queue.estimate_wait_time(queue_position)
+        status_text = (f"Your {'remixed ' if is_remix else ''}image generation request has been queued. You are number {queue_position} in line. "
+                       f"Estimated wait time: {estimated_time} seconds.")
+        response = await slack_dispatcher.call('chat_postMessage', channel=user_id, text=status_text)
+        status_updater.track(request_id, response['channel'], response['ts'], status_text, queue_position, estimated_time)
         logger.info("Queue position message sent successfully")
 
     except SDSlackBotError as e:
+        if held_reference:
+            reference_store.release(held_reference)
         logger.error(f"SDSlackBotError in process_submission: {str(e)}")
-        await client.chat_postMessage(channel=user_id, text=f"Error: {str(e)}")
+        await slack_dispatcher.call('chat_postMessage', channel=user_id, text=f"Error: {str(e)}")
     except Exception as e:
+        if held_reference:
+            reference_store.release(held_reference)
         logger.error(f"Unexpected error in process_submission: {str(e)}", exc_info=True)
-        await client.chat_postMessage(channel=user_id, text=f"An unexpected error occurred. Please try again later.")
+        await slack_dispatcher.call('chat_postMessage', channel=user_id, text=f"An unexpected error occurred. Please try again later.")
 
     # Remove any cleanup code from here
     logger.info("process_submission completed")
 
-async def open_image_gen_modal(client, trigger_id, channel_id):
-    await client.views_open(
+async def open_image_gen_modal(trigger_id, channel_id):
+    await slack_dispatcher.call(
+        'views_open',
+        priority=PRIORITY_INTERACTIVE,
         trigger_id=trigger_id,
         view={
             "type": "modal",
@@ -186,8 +209,10 @@ async def open_image_gen_modal(client, trigger_id, channel_id):
         }
     )
 
-async def open_remix_modal(client, trigger_id, original_params):
-    await client.views_open(
+async def open_remix_modal(trigger_id, original_params):
+    await slack_dispatcher.call(
+        'views_open',
+        priority=PRIORITY_INTERACTIVE,
         trigger_id=trigger_id,
         view={
             "type": "modal",
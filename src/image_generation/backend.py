@@ -0,0 +1,67 @@
+import time
+import asyncio
+import importlib
+from src.utils.logging_config import logger
+from src.utils.exceptions import ImageGenerationError
+from src.utils.startup_metrics import record_startup_event
+
+NOT_STARTED = 'not_started'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+class GenerationBackend:
+    """Loads the torch/ComfyUI stack in the background and reports when it is usable.
+
+    Nothing heavy is imported until ``start()``, so the bot can connect to Slack
+    and queue requests while ``sd_wrapper`` is imported and warmed up on a
+    worker thread. Callers that need the backend await ``wait_ready()``.
+    """
+
+    def __init__(self):
+        self.state = NOT_STARTED
+        self.error = None
+        self._module = None
+        self._settled = None
+        self._task = None
+
+    def start(self) -> asyncio.Task:
+        if self._task is None:
+            self._settled = asyncio.Event()
+            self._task = asyncio.create_task(self._initialize())
+        return self._task
+
+    async def wait_settled(self) -> str:
+        """Wait until initialization has either succeeded or failed, and return the state."""
+        self.start()
+        await self._settled.wait()
+        return self.state
+
+    async def wait_ready(self):
+        if await self.wait_settled() == FAILED:
+            raise ImageGenerationError(f"Image generation backend failed to initialize: {str(self.error)}")
+        return self._module
+
+    async def generate_images(self, batch_params, device=None, executor=None):
+        module = await self.wait_ready()
+        return await module.generate_images(batch_params, device=device, executor=executor)
+
+    async def _initialize(self) -> None:
+        self.state = LOADING
+        start_time = time.monotonic()
+        try:
+            # The import alone pulls in torch and every ComfyUI node; keep it off the event loop
+            module = await asyncio.to_thread(importlib.import_module, 'src.image_generation.sd_wrapper')
+            await module.warmup_backend()
+            self._module = module
+            self.state = READY
+            logger.info(f"Image generation backend ready in {time.monotonic() - start_time:.2f}s")
+            record_startup_event('backend_ready')
+        except Exception as e:
+            self.error = e
+            self.state = FAILED
+            logger.error(f"Image generation backend failed to initialize: {str(e)}", exc_info=True)
+        finally:
+            self._settled.set()
+
+backend = GenerationBackend()
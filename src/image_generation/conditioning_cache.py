@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+from src.utils.config import load_config
+from src.utils.logging_config import logger
+from src.image_generation.model_cache import model_cache
+
+config = load_config()
+
+def normalize_prompt(text: str) -> str:
+    # The CLIP tokenizer collapses whitespace itself, so this never changes the encoding
+    return " ".join((text or "").split())
+
+class ConditioningCache:
+    """Bounded LRU cache of CLIPTextEncode results keyed by (model cache key, normalized prompt)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_encode(self, model_key: str, text: str, encoder):
+        key = (model_key, normalize_prompt(text))
+        with self.lock:
+            conditioning = self.entries.get(key)
+            if conditioning is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return conditioning
+            self.misses += 1
+
+        conditioning = encoder(key[1])
+
+        with self.lock:
+            self.entries[key] = conditioning
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        logger.info(f"Conditioning cache miss for '{model_key}' (hit rate {self.hit_rate():.0%})")
+        return conditioning
+
+    def invalidate(self, model_key: str) -> None:
+        with self.lock:
+            stale_keys = [key for key in self.entries if key[0] == model_key]
+            for key in stale_keys:
+                del self.entries[key]
+        if stale_keys:
+            logger.info(f"Dropped {len(stale_keys)} cached conditionings for '{model_key}'")
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate(),
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+            }
+
+conditioning_cache = ConditioningCache(config['stable_diffusion'].get('conditioning_cache', {}).get('max_entries', 256))
+
+# Conditionings hold tensors produced by the checkpoint's CLIP, so they go with it
+model_cache.add_eviction_listener(conditioning_cache.invalidate)
@@ -0,0 +1,126 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import torch
+from src.utils.config import load_config
+from src.utils.logging_config import logger
+
+config = load_config()
+
+def _resolve_store_path(path: str) -> str:
+    if os.path.isabs(path):
+        return path
+    return str(Path(__file__).parent.parent.parent / path)
+
+class EmbeddingCache:
+    """CLIP-vision embeddings of reference images, kept in memory and in an on-disk store.
+
+    Entries are keyed by the image content hash, the IPAdapter preset and the embeds
+    scaling, so the vision encoder only ever runs once per distinct reference.
+    Stored tensors are memory-mapped back in, so they survive restarts cheaply.
+    """
+
+    def __init__(self, store_path: str, max_entries: int):
+        self.store_path = store_path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes = {}
+        self.lock = threading.Lock()
+        os.makedirs(self.store_path, exist_ok=True)
+
+    def get_or_encode(self, image_path: str, preset: str, embeds_scaling: str, encoder):
+        """Return ``(pos_embed, neg_embed)`` for the image, calling ``encoder()`` only on a miss."""
+        key = self._make_key(image_path, preset, embeds_scaling)
+        with self.lock:
+            embeds = self.entries.get(key)
+            if embeds is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return embeds
+
+        embeds = self._load_from_disk(key)
+        if embeds is None:
+            logger.info(f"Encoding reference image {image_path} with CLIP vision")
+            embeds = tuple(e.detach().cpu() if e is not None else None for e in encoder())
+            self._save_to_disk(key, embeds)
+            with self.lock:
+                self.misses += 1
+        else:
+            with self.lock:
+                self.hits += 1
+
+        with self.lock:
+            self.entries[key] = embeds
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return embeds
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+            }
+
+    def _make_key(self, image_path: str, preset: str, embeds_scaling: str) -> str:
+        content_hash = self._content_hash(image_path)
+        return hashlib.sha256(f"{content_hash}|{preset}|{embeds_scaling}".encode()).hexdigest()
+
+    def _content_hash(self, image_path: str) -> str:
+        stat = os.stat(image_path)
+        fingerprint = (image_path, stat.st_mtime_ns, stat.st_size)
+        content_hash = self._file_hashes.get(fingerprint)
+        if content_hash is None:
+            digest = hashlib.sha256()
+            with open(image_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            content_hash = digest.hexdigest()
+            if len(self._file_hashes) > 1024:
+                self._file_hashes.clear()
+            self._file_hashes[fingerprint] = content_hash
+        return content_hash
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.store_path, f"{key}.pt")
+
+    def _load_from_disk(self, key: str):
+        path = self._entry_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            stored = torch.load(path, mmap=True, weights_only=True)
+            return stored['pos_embed'], stored.get('neg_embed')
+        except Exception as e:
+            logger.warning(f"Discarding unreadable embedding cache entry {path}: {str(e)}")
+            os.remove(path)
+            return None
+
+    def _save_to_disk(self, key: str, embeds) -> None:
+        path = self._entry_path(key)
+        tmp_path = None
+        try:
+            # A unique temp file, so concurrent saves of the same key can't clobber each other
+            fd, tmp_path = tempfile.mkstemp(dir=self.store_path, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                torch.save({'pos_embed': embeds[0], 'neg_embed': embeds[1]}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to persist reference embeddings to {path}: {str(e)}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+_embedding_config = config['stable_diffusion'].get('embedding_cache', {})
+embedding_cache = EmbeddingCache(
+    _resolve_store_path(_embedding_config.get('path', 'data/embeddings')),
+    _embedding_config.get('max_entries', 64),
+)
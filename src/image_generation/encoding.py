@@ -0,0 +1,115 @@
+import io
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from src.utils.config import load_config
+from src.utils.logging_config import logger
+from src.utils.exceptions import ImageGenerationError
+
+config = load_config()
+
+# Pillow format name and file extension for each supported delivery format
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+    'png': ('PNG', 'png'),
+}
+
+class EncodedImage:
+    """A delivery-ready image: encoded bytes plus where its archival copy goes."""
+
+    def __init__(self, data: bytes, fmt: str, name: str, archive_path=None):
+        self.data = data
+        self.format = fmt
+        self.name = name
+        self.archive_path = archive_path
+
+    @property
+    def filename(self) -> str:
+        return f"{self.name}.{FORMATS[self.format][1]}"
+
+    def describe(self) -> str:
+        return f"{self.format.upper()} {len(self.data) / 1024:.0f} KB"
+
+class OutputEncoder:
+    """Turns a decoded image into a compact delivery derivative, entirely in memory.
+
+    Encoding is CPU-bound, so it runs on a small dedicated thread pool rather
+    than the event loop or the generation workers. When ``keep_lossless`` is set,
+    a PNG archival copy is written to ``archive_dir`` in the background; delivery
+    never waits for it.
+    """
+
+    def __init__(self, archive_dir: str, fmt: str = 'webp', quality: int = 90,
+                 keep_lossless: bool = True, workers: int = 2):
+        if fmt not in FORMATS:
+            raise ImageGenerationError(f"Unsupported output format '{fmt}', expected one of {sorted(FORMATS)}")
+        self.archive_dir = archive_dir
+        self.format = fmt
+        self.quality = quality
+        self.keep_lossless = keep_lossless
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encoder")
+
+    async def encode_image(self, image: Image.Image, name: str, on_archived=None) -> EncodedImage:
+        """Encode the delivery copy; ``on_archived(path, size)`` runs once the archival copy is written."""
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self.executor, self.encode, image)
+
+        archive_path = None
+        if self.keep_lossless:
+            archive_path = os.path.join(self.archive_dir, f"{name}.png")
+            if self.format == 'png':
+                archive = loop.run_in_executor(self.executor, self._write, archive_path, data)
+            else:
+                archive = loop.run_in_executor(self.executor, self._archive, image, archive_path)
+            archive.add_done_callback(functools.partial(self._archive_done, archive_path, len(data), on_archived))
+
+        return EncodedImage(data, self.format, name, archive_path)
+
+    def encode(self, image: Image.Image, fmt: str = None) -> bytes:
+        pil_format = FORMATS[fmt or self.format][0]
+        buffer = io.BytesIO()
+        if pil_format == 'WEBP':
+            image.save(buffer, pil_format, quality=self.quality, method=4)
+        elif pil_format == 'JPEG':
+            image.convert('RGB').save(buffer, pil_format, quality=self.quality, optimize=True, progressive=True)
+        else:
+            image.save(buffer, pil_format, compress_level=4)
+        return buffer.getvalue()
+
+    def _archive(self, image: Image.Image, path: str) -> int:
+        return self._write(path, self.encode(image, 'png'))
+
+    def _write(self, path: str, data: bytes) -> int:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _archive_done(self, path, delivery_bytes, on_archived, future) -> None:
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Failed to write archival copy: {str(error)}")
+            return
+        png_bytes = future.result()
+        if self.format != 'png' and png_bytes:
+            # The PNG is what the bot used to upload, so it is the baseline for the savings
+            logger.info(f"Archived {path} ({png_bytes / 1024:.0f} KB); the {self.format.upper()} delivery copy "
+                        f"saved {(png_bytes - delivery_bytes) / 1024:.0f} KB ({delivery_bytes / png_bytes:.0%} of the PNG)")
+        if on_archived is not None:
+            on_archived(path, png_bytes)
+
+_encoding_config = config['image_generation'].get('output_encoding', {})
+output_encoder = OutputEncoder(
+    config['stable_diffusion']['output_path'],
+    fmt=_encoding_config.get('format', 'webp'),
+    quality=_encoding_config.get('quality', 90),
+    keep_lossless=_encoding_config.get('keep_lossless', True),
+    workers=_encoding_config.get('workers', 2),
+)
@@ -0,0 +1,194 @@
+import os
+import threading
+from collections import OrderedDict
+from src.utils.config import load_config
+from src.utils.logging_config import logger
+
+config = load_config()
+
+GB = 1024 ** 3
+
+class _CacheEntry:
+    def __init__(self, ckpt_name, models, size):
+        self.ckpt_name = ckpt_name
+        self.models = models
+        self.size = size
+        self.extras = {}
+
+class ModelCache:
+    """LRU cache of loaded (model, clip, vae) checkpoints keyed by model style (and device).
+
+    Entries are evicted least-recently-used first whenever the resident
+    checkpoints would exceed the configured memory budget.
+    """
+
+    def __init__(self, max_memory_gb: float):
+        self.max_bytes = int(max_memory_gb * GB)
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+        self._loading_locks = {}
+        self._eviction_listeners = []
+
+    def add_eviction_listener(self, callback) -> None:
+        """Register ``callback(key)``, called after a checkpoint is dropped."""
+        self._eviction_listeners.append(callback)
+
+    def get_or_load(self, key: str, ckpt_name: str, loader):
+        """Return the cached checkpoint for ``key``, calling ``loader()`` on a miss.
+
+        ``key`` is the model style, suffixed with ``@device`` for device-pinned workers.
+        Loads of different keys run concurrently; loads of the same key are serialized.
+        """
+        with self._key_lock(key):
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry.ckpt_name == ckpt_name:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    logger.info(f"Model cache hit for '{key}' ({self._format_stats()})")
+                    return entry.models
+
+                self.misses += 1
+                if entry is not None:
+                    # The checkpoint configured for this style changed underneath us
+                    self._evict(key)
+
+                # Make room before loading so the old weights can be released first
+                self._evict_until_fits(_checkpoint_file_size(ckpt_name))
+
+            logger.info(f"Model cache miss for '{key}', loading {ckpt_name}")
+            models = loader()
+            size = estimate_size(models[:3]) or _checkpoint_file_size(ckpt_name)
+
+            with self.lock:
+                self._evict_until_fits(size)
+                self.entries[key] = _CacheEntry(ckpt_name, models, size)
+                self.used_bytes += size
+                logger.info(f"Cached '{key}' ({size / GB:.2f} GB, {self._format_stats()})")
+            return models
+
+    def get_or_attach(self, key: str, name: str, factory, size_of=None):
+        """Return auxiliary models kept next to a resident checkpoint, building them once.
+
+        Attached models are shared by every request on that key and released
+        together with the checkpoint. ``size_of(value)`` reports the bytes they add to
+        the budget; by default the whole value is measured.
+        """
+        with self._key_lock(key):
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and name in entry.extras:
+                    return entry.extras[name]
+
+            value = factory()
+            if entry is None:
+                return value
+            size = (size_of or estimate_size)(value)
+
+            with self.lock:
+                if self.entries.get(key) is not entry:
+                    # Evicted while we were loading; don't resurrect it
+                    return value
+                entry.extras[name] = value
+                entry.size += size
+                self.used_bytes += size
+                self._evict_until_fits(0, keep=key)
+                logger.info(f"Attached '{name}' to '{key}' ({size / GB:.2f} GB, {self._format_stats()})")
+            return value
+
+    def resident_styles(self):
+        """Model styles with a resident checkpoint on any device."""
+        with self.lock:
+            return sorted({key.split('@', 1)[0] for key in self.entries})
+
+    def _key_lock(self, key: str):
+        with self.lock:
+            return self._loading_locks.setdefault(key, threading.Lock())
+
+    def clear(self) -> None:
+        with self.lock:
+            for key in list(self.entries.keys()):
+                self._evict(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'resident': list(self.entries.keys()),
+                'used_gb': self.used_bytes / GB,
+                'max_gb': self.max_bytes / GB,
+            }
+
+    def _evict_until_fits(self, incoming_bytes: int, keep: str = None) -> None:
+        while self.used_bytes + incoming_bytes > self.max_bytes:
+            oldest = next((key for key in self.entries if key != keep), None)
+            if oldest is None:
+                break
+            self._evict(oldest)
+
+    def _evict(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        self.used_bytes -= entry.size
+        self.evictions += 1
+        extras = f" with {', '.join(entry.extras)}" if entry.extras else ""
+        logger.info(f"Evicted '{key}'{extras} from model cache ({entry.size / GB:.2f} GB freed)")
+        del entry
+        for callback in self._eviction_listeners:
+            try:
+                callback(key)
+            except Exception as e:
+                logger.error(f"Model cache eviction listener failed: {str(e)}")
+        _release_memory()
+
+    def _format_stats(self) -> str:
+        return (f"hits={self.hits} misses={self.misses} evictions={self.evictions} "
+                f"used={self.used_bytes / GB:.2f}/{self.max_bytes / GB:.2f} GB")
+
+def estimate_size(obj, depth: int = 0) -> int:
+    """Best-effort size in bytes of the weights held by loaded models, tensors or containers of them."""
+    if obj is None or depth > 4:
+        return 0
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_size(item, depth + 1) for item in obj)
+    if isinstance(obj, dict):
+        return sum(estimate_size(item, depth + 1) for item in obj.values())
+
+    patcher = getattr(obj, 'patcher', obj)
+    try:
+        if hasattr(patcher, 'model_size'):
+            return patcher.model_size()
+        if hasattr(obj, 'first_stage_model'):
+            return sum(p.numel() * p.element_size() for p in obj.first_stage_model.parameters())
+        if hasattr(obj, 'parameters'):
+            return sum(p.numel() * p.element_size() for p in obj.parameters())
+        if hasattr(obj, 'numel') and hasattr(obj, 'element_size'):
+            return obj.numel() * obj.element_size()
+    except Exception as e:
+        logger.warning(f"Could not measure model size: {str(e)}")
+    return 0
+
+def _checkpoint_file_size(ckpt_name: str) -> int:
+    try:
+        import folder_paths
+        path = folder_paths.get_full_path("checkpoints", ckpt_name)
+        return os.path.getsize(path) if path else 0
+    except Exception:
+        return 0
+
+def _release_memory() -> None:
+    try:
+        import comfy.model_management as model_management
+        model_management.cleanup_models()
+        model_management.soft_empty_cache()
+    except Exception as e:
+        logger.warning(f"Failed to release memory after eviction: {str(e)}")
+
+model_cache = ModelCache(config['stable_diffusion'].get('model_cache', {}).get('max_memory_gb', 16))
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import asyncio
+from PIL import Image
+from src.utils.config import load_config, data_file_path
+from src.utils.logging_config import logger
+from src.utils.sqlite_writer import BatchedSQLiteWriter, connect
+
+config = load_config()
+
+TIER_FULL = 'full'
+TIER_ARCHIVE = 'archive'
+
+# Files in the output directory that the backfill adopts into the index
+OUTPUT_EXTENSIONS = {'.png': TIER_FULL, '.webp': TIER_ARCHIVE, '.jpg': TIER_ARCHIVE, '.jpeg': TIER_ARCHIVE}
+
+class OutputRetention:
+    """SQLite index of generated outputs, with age- and size-based tiering.
+
+    Every archival copy written by the encoder is recorded with the request
+    that produced it. ``sweep()`` then works purely from the index:
+    full-quality PNGs older than ``archive_after_days`` are recompressed to
+    WebP, and outputs older than ``delete_after_days`` or beyond
+    ``max_total_bytes`` are deleted oldest first. The output directory is listed
+    once, by the first sweep against a new index, to adopt outputs the bot wrote
+    before the index existed; after that it is never listed again. The directory
+    is ComfyUI's and may hold other files, so only names the bot generates
+    (``ComfyUI_<model_style>_...`` for one of ``model_styles``) are adopted.
+    """
+
+    def __init__(self, db_path: str, output_dir: str, model_styles=(), archive_after_days: float = 7,
+                 archive_quality: int = 85, delete_after_days: float = None, max_total_bytes: int = None,
+                 batch_size: int = 200):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.name_prefixes = tuple(f"ComfyUI_{model_style}_" for model_style in model_styles)
+        self.archive_after_days = archive_after_days
+        self.archive_quality = archive_quality
+        self.delete_after_days = delete_after_days
+        self.max_total_bytes = max_total_bytes
+        self.batch_size = batch_size
+        self.writer = BatchedSQLiteWriter(db_path, name='output-index')
+        self._backfilled = False
+        self._opened_at = None
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = connect(self.db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS outputs (
+                    request_id TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    tier TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    request TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_outputs_tier_created ON outputs (tier, created_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_outputs_created ON outputs (created_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS outputs_meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.commit()
+            self._backfilled = conn.execute(
+                "SELECT 1 FROM outputs_meta WHERE key = 'backfilled'"
+            ).fetchone() is not None
+        finally:
+            conn.close()
+        # Outputs written from now on are recorded by the encoder callback
+        self._opened_at = time.time()
+        self.writer.start()
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def record(self, request, path: str, size: int) -> None:
+        self.writer.execute(
+            'INSERT OR REPLACE INTO outputs (request_id, path, tier, bytes, created_at, request) VALUES (?, ?, ?, ?, ?, ?)',
+            (request['id'], path, TIER_FULL, size, time.time(), json.dumps(request))
+        )
+
+    async def find_request(self, request_id):
+        """The request that produced an indexed output, for Regenerate/Remix of old images."""
+        return await asyncio.to_thread(self._find_request, request_id)
+
+    def _find_request(self, request_id):
+        conn = connect(self.db_path)
+        try:
+            row = conn.execute('SELECT request FROM outputs WHERE request_id = ?', (request_id,)).fetchone()
+            return json.loads(row['request']) if row else None
+        finally:
+            conn.close()
+
+    def sweep(self) -> None:
+        """Apply one bounded round of tiering and deletion. Blocking."""
+        now = time.time()
+        conn = connect(self.db_path)
+        try:
+            if not self._backfilled:
+                self._backfill(conn)
+            archived = self._archive_old(conn, now)
+            deleted = self._delete_expired(conn, now) + self._enforce_budget(conn)
+        finally:
+            conn.close()
+        if archived or deleted:
+            logger.info(f"Output retention: archived {archived}, deleted {deleted} output(s)")
+
+    def _backfill(self, conn) -> None:
+        """Index the bot's outputs written before the index existed, dated by their mtime."""
+        indexed = {row['path'] for row in conn.execute('SELECT path FROM outputs')}
+        rows = []
+        try:
+            with os.scandir(self.output_dir) as entries:
+                for entry in entries:
+                    tier = OUTPUT_EXTENSIONS.get(os.path.splitext(entry.name)[1].lower())
+                    if tier is None or not entry.name.startswith(self.name_prefixes):
+                        continue
+                    if not entry.is_file() or entry.path in indexed:
+                        continue
+                    stat = entry.stat()
+                    if stat.st_mtime >= self._opened_at:
+                        continue
+                    # No request survives for these, so Regenerate/Remix can't find them
+                    rows.append((f"legacy:{entry.name}", entry.path, tier, stat.st_size, stat.st_mtime, 'null'))
+        except FileNotFoundError:
+            pass
+        conn.executemany(
+            'INSERT OR IGNORE INTO outputs (request_id, path, tier, bytes, created_at, request) VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+        conn.execute("INSERT OR REPLACE INTO outputs_meta (key, value) VALUES ('backfilled', ?)", (str(time.time()),))
+        conn.commit()
+        self._backfilled = True
+        if rows:
+            logger.info(f"Output retention: indexed {len(rows)} existing output(s) from {self.output_dir}")
+
+    def _archive_old(self, conn, now) -> int:
+        if self.archive_after_days is None:
+            return 0
+        rows = conn.execute(
+            'SELECT request_id, path FROM outputs WHERE tier = ? AND created_at < ? ORDER BY created_at LIMIT ?',
+            (TIER_FULL, now - self.archive_after_days * 86400, self.batch_size)
+        ).fetchall()
+        archived = 0
+        for row in rows:
+            archive_path = f"{os.path.splitext(row['path'])[0]}.webp"
+            try:
+                with Image.open(row['path']) as image:
+                    image.save(archive_path, 'WEBP', quality=self.archive_quality, method=6)
+                size = os.path.getsize(archive_path)
+                os.remove(row['path'])
+            except FileNotFoundError:
+                # Deleted outside the bot; drop it from the index
+                conn.execute('DELETE FROM outputs WHERE request_id = ?', (row['request_id'],))
+                continue
+            except OSError as e:
+                logger.warning(f"Failed to archive output {row['path']}: {str(e)}")
+                continue
+            conn.execute(
+                'UPDATE outputs SET path = ?, tier = ?, bytes = ? WHERE request_id = ?',
+                (archive_path, TIER_ARCHIVE, size, row['request_id'])
+            )
+            archived += 1
+        conn.commit()
+        return archived
+
+    def _delete_expired(self, conn, now) -> int:
+        if self.delete_after_days is None:
+            return 0
+        rows = conn.execute(
+            'SELECT request_id, path FROM outputs WHERE created_at < ? ORDER BY created_at LIMIT ?',
+            (now - self.delete_after_days * 86400, self.batch_size)
+        ).fetchall()
+        return self._delete(conn, rows)
+
+    def _enforce_budget(self, conn) -> int:
+        if self.max_total_bytes is None:
+            return 0
+        total = conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM outputs').fetchone()[0]
+        if total <= self.max_total_bytes:
+            return 0
+
+        victims = []
+        for row in conn.execute(
+            'SELECT request_id, path, bytes FROM outputs ORDER BY created_at LIMIT ?', (self.batch_size,)
+        ):
+            if total <= self.max_total_bytes:
+                break
+            victims.append(row)
+            total -= row['bytes']
+        return self._delete(conn, victims)
+
+    def _delete(self, conn, rows) -> int:
+        deleted = 0
+        for row in rows:
+            try:
+                os.remove(row['path'])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to delete output {row['path']}: {str(e)}")
+                continue
+            conn.execute('DELETE FROM outputs WHERE request_id = ?', (row['request_id'],))
+            deleted += 1
+        conn.commit()
+        return deleted
+
+_retention_config = config['stable_diffusion'].get('output_retention', {})
+output_retention = OutputRetention(
+    data_file_path('outputs.db', _retention_config.get('index_path')),
+    config['stable_diffusion']['output_path'],
+    model_styles=list(config['stable_diffusion']['models']),
+    archive_after_days=_retention_config.get('archive_after_days', 7),
+    archive_quality=_retention_config.get('archive_quality', 85),
+    delete_after_days=_retention_config.get('delete_after_days'),
+    max_total_bytes=_retention_config.get('max_total_bytes'),
+    batch_size=_retention_config.get('sweep_batch_size', 200),
+)
@@ -0,0 +1,95 @@
+import os
+import glob
+import asyncio
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps
+from src.utils.config import load_config
+from src.utils.logging_config import logger
+from src.utils.exceptions import ImageGenerationError
+from src.utils.reference_store import reference_store
+
+config = load_config()
+
+class ReferencePreprocessor:
+    """Decodes each reference image once into the small array CLIP vision consumes.
+
+    The image is opened, orientation-corrected from EXIF, converted to RGB and
+    downscaled so its short side is ``short_side`` (CLIP vision resizes to that
+    and center-crops, so nothing it would see is lost). The result is stored as
+    a uint8 ``.npy`` keyed by source path and mtime, which generation loads
+    directly instead of decoding the full-resolution upload again.
+    """
+
+    def __init__(self, cache_dir: str, short_side: int = 224, workers: int = 2):
+        self.cache_dir = cache_dir
+        self.short_side = short_side
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reference-preprocess")
+        os.makedirs(cache_dir, exist_ok=True)
+
+    async def prepare(self, image_path: str) -> str:
+        """Preprocess on the worker pool, ahead of generation."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.preprocess, image_path)
+
+    def preprocess(self, image_path: str) -> str:
+        """Return the path of the preprocessed array, creating it if needed. Blocking."""
+        array_path = self._array_path(image_path)
+        if os.path.exists(array_path):
+            return array_path
+
+        try:
+            with Image.open(image_path) as image:
+                image = ImageOps.exif_transpose(image).convert('RGB')
+                width, height = image.size
+                scale = self.short_side / min(width, height)
+                if scale < 1:
+                    image = image.resize((round(width * scale), round(height * scale)), Image.BICUBIC)
+                pixels = np.asarray(image, dtype=np.uint8)
+        except (OSError, ValueError) as e:
+            raise ImageGenerationError(f"Reference image could not be decoded: {image_path}: {str(e)}")
+
+        # Workers may prepare the same image concurrently; each writes its own temp file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, pixels)
+            os.replace(tmp_path, array_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        logger.info(f"Preprocessed reference image {image_path} from {width}x{height} to "
+                    f"{pixels.shape[1]}x{pixels.shape[0]}")
+        return array_path
+
+    def load(self, image_path: str) -> np.ndarray:
+        """The preprocessed HxWx3 uint8 array, decoding the source only if it wasn't prepared."""
+        return np.load(self.preprocess(image_path))
+
+    def discard(self, image_path: str) -> None:
+        """Remove every preprocessed version of ``image_path``."""
+        for path in glob.glob(os.path.join(self.cache_dir, f"{self._path_digest(image_path)}_*.npy")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _array_path(self, image_path: str) -> str:
+        # Raises FileNotFoundError for a missing source, like the decode would
+        mtime_ns = os.stat(image_path).st_mtime_ns
+        return os.path.join(self.cache_dir, f"{self._path_digest(image_path)}_{mtime_ns}.npy")
+
+    def _path_digest(self, image_path: str) -> str:
+        return hashlib.sha256(os.path.abspath(image_path).encode()).hexdigest()[:32]
+
+_preprocessing_config = config['image_generation'].get('reference_preprocessing', {})
+reference_preprocessor = ReferencePreprocessor(
+    os.path.join(config['temp_dir'], 'preprocessed'),
+    short_side=_preprocessing_config.get('short_side', 224),
+    workers=_preprocessing_config.get('workers', 2),
+)
+
+# Preprocessed arrays are derived from stored blobs, so they go with them
+reference_store.add_removal_listener(reference_preprocessor.discard)
@@ -1,14 +1,22 @@
 import sys
 import os
+import math
 import time
 import asyncio
+import threading
+import contextlib
 import torch
+from concurrent.futures import Executor
 from PIL import Image
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from src.utils.config import load_config
 from src.utils.logging_config import logger
 from src.utils.exceptions import ImageGenerationError
+from src.image_generation.model_cache import model_cache, estimate_size as model_cache_size
+from src.image_generation.conditioning_cache import conditioning_cache
+from src.image_generation.embedding_cache import embedding_cache
+from src.image_generation.reference_preprocessing import reference_preprocessor
 
 config = load_config()
 sys.path.append(config['stable_diffusion']['comfyui_path'])
@@ -16,7 +24,6 @@ sys.path.append(config['stable_diffusion']['comfyui_path'])
 # Import ComfyUI modules
 from nodes import (
     CLIPTextEncode,
-    SaveImage,
     NODE_CLASS_MAPPINGS,
     VAEDecode,
     KSampler,
@@ -24,6 +31,9 @@ from nodes import (
     EmptyLatentImage,
 )
 
+IPADAPTER_PRESET = "PLUS (high strength)"
+EMBEDS_SCALING = "V only"
+
 def import_custom_nodes() -> None:
     """Find all custom nodes in the custom_nodes folder and add those node objects to NODE_CLASS_MAPPINGS
 
@@ -47,13 +57,92 @@ def import_custom_nodes() -> None:
     init_builtin_extra_nodes()
     init_external_custom_nodes()
 
-def load_model(model_style: str):
+_runtime_lock = threading.Lock()
+_runtime_initialized = False
+
+def ensure_runtime() -> None:
+    """Initialize the ComfyUI node registry once per process."""
+    global _runtime_initialized
+    if _runtime_initialized:
+        return
+    with _runtime_lock:
+        if _runtime_initialized:
+            return
+        start_time = time.time()
+        import_custom_nodes()
+        _runtime_initialized = True
+        logger.info(f"ComfyUI runtime initialized in {time.time() - start_time:.2f}s")
+
+def _warmup_targets(model_styles: List[str]) -> List[tuple]:
+    """(model_style, device) pairs for every worker that serves one of ``model_styles``."""
+    targets = []
+    for worker_config in config['queue'].get('workers') or [{}]:
+        served = worker_config.get('models')
+        for model_style in model_styles:
+            target = (model_style, worker_config.get('device'))
+            if (not served or model_style in served) and target not in targets:
+                targets.append(target)
+    return targets
+
+def warmup() -> None:
+    """Bootstrap the runtime, preload the configured checkpoints and run a tiny generation on each.
+
+    This moves node discovery, weight loading and kernel initialization out of the first user request.
+    Each checkpoint is warmed on every worker device that serves it, under the same device-scoped cache
+    key that generation uses.
+    """
+    warmup_config = config['stable_diffusion'].get('warmup', {})
+    ensure_runtime()
+    for model_style, device in _warmup_targets(warmup_config.get('models', [])):
+        start_time = time.time()
+        try:
+            with torch.inference_mode(), _device_context(device):
+                _run_pipeline(
+                    positive_prompts=["warmup"],
+                    negative_prompts=[config['image_generation']['default_negative_prompt']],
+                    width=warmup_config.get('size', 256),
+                    height=warmup_config.get('size', 256),
+                    reference_image_path=config['stable_diffusion']['default_reference_path'],
+                    reference_weight=0.5,
+                    model_style=model_style,
+                    seed=0,
+                    steps=1,
+                    device=device,
+                )
+            logger.info(f"Warmup for '{model_style}' on {device or 'the default device'} "
+                        f"completed in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            logger.error(f"Warmup for '{model_style}' on {device or 'the default device'} failed: {str(e)}",
+                         exc_info=True)
+
+async def warmup_backend() -> None:
+    # import_custom_nodes() installs its own event loop, so keep it off the bot's thread
+    loop = asyncio.get_running_loop()
+    if config['stable_diffusion'].get('warmup', {}).get('enabled', False):
+        await loop.run_in_executor(None, warmup)
+    else:
+        await loop.run_in_executor(None, ensure_runtime)
+
+def model_cache_key(model_style: str, device: Optional[str] = None) -> str:
+    return model_style if device is None else f"{model_style}@{device}"
+
+def load_model(model_style: str, device: Optional[str] = None):
     model_path = config['stable_diffusion']['models'].get(model_style)
     if not model_path:
         raise ImageGenerationError(f"Invalid model style: {model_style}")
 
-    checkpointloadersimple = CheckpointLoaderSimple()
-    return checkpointloadersimple.load_checkpoint(ckpt_name=model_path)
+    def load_checkpoint():
+        checkpointloadersimple = CheckpointLoaderSimple()
+        return checkpointloadersimple.load_checkpoint(ckpt_name=model_path)
+
+    return model_cache.get_or_load(model_cache_key(model_style, device), model_path, load_checkpoint)
+
+def _device_context(device: Optional[str]):
+    """Make ComfyUI place models on ``device`` for the calling thread."""
+    if device is not None and device.startswith('cuda'):
+        # ComfyUI resolves its torch device from the thread's current CUDA device
+        return torch.cuda.device(torch.device(device))
+    return contextlib.nullcontext()
 
 async def generate_image(
     positive_prompt: str,
@@ -64,15 +153,37 @@ async def generate_image(
     reference_weight: float,
     model_style: str,
     seed: Optional[int] = None
-) -> str:
-    logger.info(f"Starting image generation with parameters: {locals()}")
+) -> Image.Image:
+    results = await generate_images([{
+        'positive_prompt': positive_prompt,
+        'negative_prompt': negative_prompt,
+        'width': width,
+        'height': height,
+        'reference_image_path': reference_image_path,
+        'reference_weight': reference_weight,
+        'model_style': model_style,
+        'seed': seed,
+    }])
+    return results[0]
+
+async def generate_images(
+    batch_params: List[dict],
+    device: Optional[str] = None,
+    executor: Optional[Executor] = None
+) -> List[Image.Image]:
+    """Generate one image per entry in a single sampler pass.
+
+    All entries must share model style, size, reference image and reference weight
+    (see ``batch_key`` in the request queue); only the prompts may differ.
+    Returns the decoded images in the same order as ``batch_params``; nothing is written to disk. ``device`` pins the
+    work to a specific torch device and ``executor`` to a specific worker thread.
+    """
+    logger.info(f"Starting image generation for a batch of {len(batch_params)} with parameters: {batch_params}")
 
     try:
         # Run the CPU-bound operations in a thread pool
         loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, _generate_image_sync,
-                                            positive_prompt, negative_prompt, width, height,
-                                            reference_image_path, reference_weight, model_style, seed)
+        result = await loop.run_in_executor(executor, _generate_images_sync, batch_params, device)
         logger.info("Image generation completed successfully")
         return result
     except FileNotFoundError as e:
@@ -82,108 +193,154 @@ async def generate_image(
         logger.error(f"Error during image generation: {str(e)}", exc_info=True)
         raise ImageGenerationError(f"Failed to generate image: {str(e)}")
 
-def _generate_image_sync(
-    positive_prompt: str,
-    negative_prompt: str,
+def _generate_images_sync(batch_params: List[dict], device: Optional[str] = None) -> List[Image.Image]:
+    first = batch_params[0]
+    seed = next((params['seed'] for params in batch_params if params.get('seed') is not None), None)
+    model_style = first['model_style']
+
+    ensure_runtime()
+    with torch.inference_mode(), _device_context(device):
+        decoded_image = _run_pipeline(
+            [params['positive_prompt'] for params in batch_params],
+            [params['negative_prompt'] for params in batch_params],
+            first['width'], first['height'],
+            first['reference_image_path'], first['reference_weight'],
+            model_style, seed, device=device,
+        )
+
+        # Hand the images straight to the caller instead of round-tripping through SaveImage
+        pixels = (decoded_image[0].clamp(0, 1) * 255).round().to(torch.uint8).cpu().numpy()
+
+    images = [Image.fromarray(pixels[i]) for i in range(len(batch_params))]
+    logger.info(f"Image generation completed for {len(images)} {model_style} image(s)")
+    return images
+
+def _batch_conditioning(conditionings):
+    """Stack single-entry CLIPTextEncode outputs into one conditioning with a row per image.
+
+    Prompts that span a different number of 77-token chunks are repeated up to a common
+    length, which is how ComfyUI itself concatenates cross-attention conditioning.
+    """
+    if len(conditionings) == 1:
+        return conditionings[0]
+
+    tensors = [conditioning[0][0][0] for conditioning in conditionings]
+    token_length = math.lcm(*(tensor.shape[1] for tensor in tensors))
+    cond = torch.cat([tensor.repeat(1, token_length // tensor.shape[1], 1) for tensor in tensors])
+
+    extras = {}
+    pooled = [conditioning[0][0][1].get('pooled_output') for conditioning in conditionings]
+    if all(p is not None for p in pooled):
+        extras['pooled_output'] = torch.cat(pooled)
+    return ([[cond, extras]],)
+
+def _run_pipeline(
+    positive_prompts: List[str],
+    negative_prompts: List[str],
     width: int,
     height: int,
     reference_image_path: str,
     reference_weight: float,
     model_style: str,
-    seed: Optional[int] = None
-) -> str:
-    import_custom_nodes()
-    with torch.inference_mode():
-        # Load model
-        model = load_model(model_style)
+    seed: Optional[int] = None,
+    steps: int = 15,
+    device: Optional[str] = None
+):
+    """Run the sampling graph and return the VAEDecode result. Callers must hold inference mode."""
+    # Load model
+    model = load_model(model_style, device)
+    cache_key = model_cache_key(model_style, device)
 
-        # Load reference image
-        logger.info(f"Attempting to load reference image from: {reference_image_path}")
+    # The reference is decoded by the preprocessing stage; only check it is still there
+    logger.info(f"Using reference image: {reference_image_path}")
 
-        if not os.path.exists(reference_image_path):
-            raise FileNotFoundError(f"Reference image file does not exist: {reference_image_path}")
+    if not os.path.exists(reference_image_path):
+        raise FileNotFoundError(f"Reference image file does not exist: {reference_image_path}")
 
-        # Verify the image again before loading
-        try:
-            with Image.open(reference_image_path) as img:
-                img.verify()
-            logger.info(f"Reference image verified successfully: {reference_image_path}")
-        except Exception as e:
-            logger.error(f"Failed to verify reference image: {str(e)}")
-            # Try to log some information about the file
-            try:
-                file_size = os.path.getsize(reference_image_path)
-                logger.info(f"File size: {file_size} bytes")
-                with open(reference_image_path, 'rb') as f:
-                    first_bytes = f.read(100)
-                logger.info(f"First 100 bytes of the file: {first_bytes}")
-            except Exception as debug_e:
-                logger.error(f"Error while debugging file: {str(debug_e)}")
-            raise FileNotFoundError(f"Reference image file is corrupted: {reference_image_path}")
-
-        loadimagefrompath = NODE_CLASS_MAPPINGS["LoadImageFromPath"]()
-        loadimagefrompath_result = loadimagefrompath.load_image(image=reference_image_path)
-
-        # Encode prompts
-        cliptextencode = CLIPTextEncode()
-        positive_conditioning = cliptextencode.encode(text=positive_prompt, clip=model[1])
-        negative_conditioning = cliptextencode.encode(text=negative_prompt, clip=model[1])
-
-        # Generate empty latent image
-        emptylatentimage = EmptyLatentImage()
-        latent_image = emptylatentimage.generate(width=width, height=height, batch_size=1)
-
-        # Apply IP-Adapter
+    # Encode prompts, reusing cached conditionings for repeated prompts
+    cliptextencode = CLIPTextEncode()
+
+    def encode(text):
+        return cliptextencode.encode(text=text, clip=model[1])
+
+    positive_conditioning = _batch_conditioning(
+        [conditioning_cache.get_or_encode(cache_key, prompt, encode) for prompt in positive_prompts]
+    )
+    negative_conditioning = _batch_conditioning(
+        [conditioning_cache.get_or_encode(cache_key, prompt, encode) for prompt in negative_prompts]
+    )
+
+    # Generate empty latent image
+    emptylatentimage = EmptyLatentImage()
+    latent_image = emptylatentimage.generate(width=width, height=height, batch_size=len(positive_prompts))
+
+    # Apply IP-Adapter, with the IPAdapter and CLIP vision weights kept resident next to the checkpoint
+    def load_ipadapter():
         ipadapterunifiedloader = NODE_CLASS_MAPPINGS["IPAdapterUnifiedLoader"]()
-        ipadapter_model = ipadapterunifiedloader.load_models(
-            preset="PLUS (high strength)",
+        return ipadapterunifiedloader.load_models(
+            preset=IPADAPTER_PRESET,
             model=model[0],
         )
 
-        ipadapteradvanced = NODE_CLASS_MAPPINGS["IPAdapterAdvanced"]()
-        ipadapter_result = ipadapteradvanced.apply_ipadapter(
-            weight=reference_weight,
-            weight_type="style transfer",
-            combine_embeds="concat",
-            start_at=0,
-            end_at=1,
-            embeds_scaling="V only",
-            model=ipadapter_model[0],
+    # The returned model is a clone sharing the checkpoint's weights, so only the IPAdapter side counts
+    ipadapter_model = model_cache.get_or_attach(
+        cache_key, "ipadapter", load_ipadapter, size_of=lambda result: model_cache_size(result[1])
+    )
+
+    # The reference only goes through CLIP vision once; the weight is applied by IPAdapterEmbeds
+    def encode_reference():
+        # Load the array decoded and downscaled once by the preprocessing stage as a 1xHxWx3 IMAGE
+        pixels = reference_preprocessor.load(reference_image_path)
+        image = torch.from_numpy(pixels).float().div_(255).unsqueeze(0)
+        ipadapterencoder = NODE_CLASS_MAPPINGS["IPAdapterEncoder"]()
+        return ipadapterencoder.encode(
             ipadapter=ipadapter_model[1],
-            image=loadimagefrompath_result[0],
+            image=image,
+            weight=1.0,
         )
 
-        # Apply perturbed attention guidance
-        perturbedattentionguidance = NODE_CLASS_MAPPINGS["PerturbedAttentionGuidance"]()
-        pag_result = perturbedattentionguidance.patch(scale=3, model=ipadapter_result[0])
-
-        # Apply automatic CFG
-        automatic_cfg = NODE_CLASS_MAPPINGS["Automatic CFG"]()
-        cfg_result = automatic_cfg.patch(hard_mode=True, boost=True, model=pag_result[0])
-
-        # Sample
-        ksampler = KSampler()
-        sampler_result = ksampler.sample(
-            seed=seed if seed is not None else torch.randint(0, 2**32 - 1, (1,)).item(),
-            steps=15,
-            cfg=2.5,
-            sampler_name="dpmpp_3m_sde_gpu",
-            scheduler="exponential",
-            denoise=1,
-            model=cfg_result[0],
-            positive=positive_conditioning[0],
-            negative=negative_conditioning[0],
-            latent_image=latent_image[0],
-        )
+    pos_embed, neg_embed = embedding_cache.get_or_encode(
+        reference_image_path, IPADAPTER_PRESET, EMBEDS_SCALING, encode_reference
+    )
+
+    ipadapterembeds = NODE_CLASS_MAPPINGS["IPAdapterEmbeds"]()
+    ipadapter_result = ipadapterembeds.apply_ipadapter(
+        weight=reference_weight,
+        weight_type="style transfer",
+        start_at=0,
+        end_at=1,
+        embeds_scaling=EMBEDS_SCALING,
+        model=ipadapter_model[0],
+        ipadapter=ipadapter_model[1],
+        pos_embed=pos_embed,
+        neg_embed=neg_embed,
+    )
+
+    # Apply perturbed attention guidance
+    perturbedattentionguidance = NODE_CLASS_MAPPINGS["PerturbedAttentionGuidance"]()
+    pag_result = perturbedattentionguidance.patch(scale=3, model=ipadapter_result[0])
+
+    # Apply automatic CFG
+    automatic_cfg = NODE_CLASS_MAPPINGS["Automatic CFG"]()
+    cfg_result = automatic_cfg.patch(hard_mode=True, boost=True, model=pag_result[0])
 
-        # Decode VAE
-        vaedecode = VAEDecode()
-        decoded_image = vaedecode.decode(samples=sampler_result[0], vae=model[2])
+    # Sample
+    ksampler = KSampler()
+    sampler_result = ksampler.sample(
+        seed=seed if seed is not None else torch.randint(0, 2**32 - 1, (1,)).item(),
+        steps=steps,
+        cfg=2.5,
+        sampler_name="dpmpp_3m_sde_gpu",
+        scheduler="exponential",
+        denoise=1,
+        model=cfg_result[0],
+        positive=positive_conditioning[0],
+        negative=negative_conditioning[0],
+        latent_image=latent_image[0],
+    )
 
-        # Save image
-        saveimage = SaveImage()
-        output_path = os.path.join(config['stable_diffusion']['output_path'], f"ComfyUI_{model_style}_{os.urandom(4).hex()}.png")
-        saveimage.save_images(filename_prefix=output_path, images=decoded_image[0])
+    # Decode VAE
+    vaedecode = VAEDecode()
+    decoded_image = vaedecode.decode(samples=sampler_result[0], vae=model[2])
 
-        logger.info(f"Image generation completed. Saved as {output_path}")
-        return output_path
+    return decoded_image
@@ -1,18 +1,37 @@
+# Imported first so startup timings are measured from here
+from src.utils.startup_metrics import record_startup_event
 from src.stats.database import init_db
+from src.stats.tracker import stats_recorder
 from src.scheduler import start_scheduler
 from src.bot.slack_interface import start_bot
+from src.bot.queue_processor import wait_recovered
+from src.image_generation.backend import backend
 from src.utils.logging_config import logger
 from src.utils.exceptions import SDSlackBotError
+from src.utils.config import load_config
 
 import asyncio
 from src.utils.temp_dir_manager import temp_dir_manager
+from src.utils.reference_store import reference_store
+from src.image_generation.output_retention import output_retention
 
-async def cleanup_temp_files():
+config = load_config()
+
+async def cleanup_files():
+    # Sweeps touch the disk, so they run in a worker thread
+    interval = config.get('temp', {}).get('sweep_interval_seconds', 60)
+    # Reference blobs needed by recovered requests are only held once recovery has run
+    await wait_recovered()
     while True:
-        temp_dir_manager.cleanup_old_files()
-        await asyncio.sleep(3600)  # Run every hour
+        for sweep in (temp_dir_manager.sweep, reference_store.sweep, output_retention.sweep):
+            try:
+                await asyncio.to_thread(sweep)
+            except Exception as e:
+                logger.error(f"File sweep failed: {str(e)}")
+        await asyncio.sleep(interval)
 
 async def main():
+    cleanup_task = None
     try:
         logger.info("Initializing database")
         try:
@@ -20,19 +39,36 @@ async def main():
         except Exception as e:
             logger.error(f"Failed to initialize database: {str(e)}")
             raise
+        stats_recorder.start()
+        output_retention.open()
+
+        reload_config = config.get('config_reload', {})
+        if reload_config.get('enabled', False):
+            config.start_watching(reload_config.get('interval', 5))
 
         logger.info("Starting scheduler")
         start_scheduler()
 
+        # Slack connects right away; the backend loads and warms up in the background
+        logger.info("Bootstrapping image generation backend")
+        backend.start()
+
+        # Start the cleanup task before start_bot, which only returns on shutdown
+        cleanup_task = asyncio.create_task(cleanup_files())
+
+        record_startup_event('init_complete')
         logger.info("Starting SD Slack Bot")
         await start_bot()
     except SDSlackBotError as e:
         logger.error(f"An error occurred: {str(e)}")
     except Exception as e:
         logger.critical(f"An unexpected error occurred: {str(e)}", exc_info=True)
-
-    # Start the cleanup task
-    asyncio.create_task(cleanup_temp_files())
+    finally:
+        if cleanup_task is not None:
+            cleanup_task.cancel()
+        # Flush any buffered stats and output index entries before exiting
+        stats_recorder.close()
+        output_retention.close()
 
 if __name__ == "__main__":
     import asyncio
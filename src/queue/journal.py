@@ -0,0 +1,95 @@
+import os
+import json
+import time
+from ..utils.logging_config import logger
+from ..utils.sqlite_writer import BatchedSQLiteWriter, connect
+from .request_registry import QUEUED, IN_FLIGHT, COMPLETED
+
+class QueueJournal:
+    """Crash-safe record of the request queue in a SQLite WAL database.
+
+    State changes are buffered and committed in small groups by a background
+    writer, so journaling adds no I/O to the enqueue path. On startup,
+    ``recover()`` returns every request that was queued or in flight when the
+    process stopped. Completed rows are pruned once they are older than
+    ``retention_seconds``, at startup and then at most every ``prune_interval``.
+    """
+
+    def __init__(self, db_path: str, retention_seconds: float = 86400, prune_interval: float = 3600):
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self.writer = BatchedSQLiteWriter(db_path, name='queue-journal')
+        self._next_prune = time.time() + prune_interval
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = connect(self.db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS queue_journal (
+                    id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    queued_at REAL,
+                    updated_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_queue_journal_state ON queue_journal (state, queued_at)')
+            conn.commit()
+        finally:
+            conn.close()
+        self.writer.start()
+        logger.info(f"Queue journal opened at {self.db_path}")
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def record_queued(self, request) -> None:
+        self.writer.execute(
+            'INSERT OR REPLACE INTO queue_journal (id, payload, state, queued_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (request['id'], json.dumps(request), QUEUED, request.get('queued_at', time.time()), time.time())
+        )
+
+    def record_in_flight(self, request) -> None:
+        self._set_state(request['id'], IN_FLIGHT)
+
+    def record_completed(self, request) -> None:
+        self._set_state(request['id'], COMPLETED)
+        now = time.time()
+        if now >= self._next_prune:
+            # Runs in the writer's next batch, like any other journal write
+            self._next_prune = now + self.prune_interval
+            self.writer.execute(
+                'DELETE FROM queue_journal WHERE state = ? AND updated_at < ?',
+                (COMPLETED, now - self.retention_seconds)
+            )
+
+    def recover(self):
+        """Return unfinished requests in arrival order, and prune old completed ones."""
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(
+                'SELECT payload, state FROM queue_journal WHERE state != ? ORDER BY queued_at',
+                (COMPLETED,)
+            ).fetchall()
+            conn.execute(
+                'DELETE FROM queue_journal WHERE state = ? AND updated_at < ?',
+                (COMPLETED, time.time() - self.retention_seconds)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        requests = [json.loads(row['payload']) for row in rows]
+        in_flight = sum(1 for row in rows if row['state'] == IN_FLIGHT)
+        if requests:
+            logger.info(f"Recovered {len(requests)} unfinished request(s) from the queue journal "
+                        f"({in_flight} were in flight)")
+        return requests
+
+    def _set_state(self, request_id, state) -> None:
+        self.writer.execute(
+            'UPDATE queue_journal SET state = ?, updated_at = ? WHERE id = ?',
+            (state, time.time(), request_id)
+        )
@@ -1,47 +1,248 @@
+import math
+import time
 import asyncio
 from collections import deque
-from ..utils.config import load_config
+from ..utils.config import load_config, data_file_path
 from ..utils.logging_config import logger
+from .scheduling import FifoPolicy, create_policy
+from .request_registry import RequestRegistry
+from .journal import QueueJournal
 
 config = load_config()
 
+def batch_key(request):
+    """Requests sharing this key can be sampled together in one batch."""
+    params = request['params']
+    return (
+        params['model_style'],
+        params['width'],
+        params['height'],
+        params['reference_image_path'],
+        params['reference_weight'],
+    )
+
 class RequestQueue:
     def __init__(self):
         self.queue = deque()
-        self.current_request = None
+        self.in_flight = {}
+        history_config = config['queue'].get('history', {})
+        self.registry = RequestRegistry(
+            max_history=history_config.get('max_entries', 1000),
+            spill_to_db=history_config.get('spill_to_db', False),
+        )
+        journal_config = config['queue'].get('journal', {})
+        self.journal = None
+        if journal_config.get('enabled', False):
+            self.journal = QueueJournal(
+                data_file_path('queue.db', journal_config.get('path')),
+                journal_config.get('retention_seconds', 86400),
+            )
+        self.slots = max(1, len(config['queue'].get('workers') or [{}]))
         self.lock = asyncio.Lock()
+        self.not_empty = asyncio.Condition(self.lock)
+        self.closed = False
+        self.policy = create_policy(config['queue'].get('scheduling', {}))
+        self.loaded_models = set()
+        self.skips = {}
+        self.swaps_avoided = 0
+        config.add_reload_listener(self._reload_policy)
+
+    def _reload_policy(self):
+        # Swapping the reference is atomic; the next selection uses the new policy
+        self.policy = create_policy(config['queue'].get('scheduling', {}))
 
     async def add_request(self, request):
-        async with self.lock:
+        async with self.not_empty:
+            request.setdefault('queued_at', time.time())
             self.queue.append(request)
-            return len(self.queue)
+            self.registry.add_queued(request)
+            if self.journal:
+                self.journal.record_queued(request)
+            self.not_empty.notify_all()
+            return self._position_of(request['id'])
 
-    async def get_next_request(self):
-        async with self.lock:
-            if self.queue:
-                self.current_request = self.queue.popleft()
-                return self.current_request
-            return None
+    async def recover(self):
+        """Open the journal and re-queue whatever was queued or in flight before a restart."""
+        if self.journal is None:
+            return 0
+        await asyncio.to_thread(self.journal.open)
+        requests = await asyncio.to_thread(self.journal.recover)
+        async with self.not_empty:
+            for request in requests:
+                self.queue.append(request)
+                self.registry.add_queued(request)
+                self.journal.record_queued(request)
+            self.not_empty.notify_all()
+        return len(requests)
+
+    async def close_storage(self):
+        """Flush the journal and the request history to disk."""
+        await asyncio.to_thread(self.registry.close)
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.close)
+
+    async def close(self):
+        """Stop handing out work; consumers blocked in get_next_batch() return an empty batch."""
+        async with self.not_empty:
+            self.closed = True
+            self.not_empty.notify_all()
+
+    async def wait_closed(self):
+        """Block until close() is called."""
+        async with self.not_empty:
+            await self.not_empty.wait_for(lambda: self.closed)
+
+    async def get_next_request(self, model_styles=None):
+        batch = await self.get_next_batch(1, 0, model_styles)
+        return batch[0] if batch else None
+
+    async def get_next_batch(self, max_size=1, wait_seconds=0, model_styles=None):
+        """Wait for the next request and pop it with up to ``max_size - 1`` compatible queued requests.
+
+        Blocks until a request this consumer can serve is queued, and returns an empty
+        batch once the queue is closed. If the batch is not full, keep collecting
+        compatible arrivals for up to ``wait_seconds``. ``model_styles`` restricts the
+        batch to requests a model-pinned worker can serve.
+        """
+        async with self.not_empty:
+            await self.not_empty.wait_for(lambda: self.closed or self._has_eligible(model_styles))
+            if self.closed:
+                return []
+            batch = [self._pop_next(model_styles)]
+            self._take_compatible(batch, max_size)
+            self._mark_in_flight(batch)
+
+            try:
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + wait_seconds
+                while len(batch) < max_size and not self.closed:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self.not_empty.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    self._take_compatible(batch, max_size)
+                    self._mark_in_flight(batch)
+            except asyncio.CancelledError:
+                # Don't lose requests that were already taken off the queue
+                for request in reversed(batch):
+                    self.in_flight.pop(request['id'], None)
+                    self.queue.appendleft(request)
+                    self.registry.add_queued(request)
+                    if self.journal:
+                        self.journal.record_queued(request)
+                raise
+        return batch
 
-    async def complete_current_request(self):
+    async def complete_requests(self, requests):
+        """Free the slot held by a finished batch."""
         async with self.lock:
-            self.current_request = None
+            for request in requests:
+                self.in_flight.pop(request['id'], None)
+                self.registry.complete(request)
+                if self.journal:
+                    self.journal.record_completed(request)
+
+    def set_loaded_models(self, model_styles):
+        """Tell the scheduler which checkpoints are resident, so it can avoid swaps."""
+        self.loaded_models = set(model_styles)
+
+    def queued_requests(self):
+        """Queued requests in the order they are expected to be served."""
+        return self._projected_order()
 
     async def get_queue_position(self, request_id):
         async with self.lock:
-            for i, request in enumerate(self.queue):
-                if request['id'] == request_id:
-                    return i + 1
-            return None
+            return self._position_of(request_id)
 
     async def get_request_by_id(self, request_id):
+        """Look up a queued, in-flight or previously completed request."""
         async with self.lock:
-            for request in self.queue:
-                if request['id'] == request_id:
-                    return request
-            return None
+            request = self.registry.get(request_id)
+        if request is None:
+            request = await self.registry.lookup_spilled(request_id)
+        return request
 
     def estimate_wait_time(self, position):
-        return position * config['queue']['estimated_generation_time']
+        # Requests ahead are spread across every generation slot
+        rounds = math.ceil(position / self.slots)
+        return rounds * config['queue']['estimated_generation_time']
+
+    def _has_eligible(self, model_styles):
+        if model_styles is None:
+            return bool(self.queue)
+        return any(request['params']['model_style'] in model_styles for request in self.queue)
+
+    def _mark_in_flight(self, batch):
+        for request in batch:
+            if request['id'] in self.in_flight:
+                continue
+            self.in_flight[request['id']] = request
+            self.registry.mark_in_flight(request)
+            if self.journal:
+                self.journal.record_in_flight(request)
+
+    def _pop_next(self, model_styles=None):
+        candidates = [i for i, request in enumerate(self.queue)
+                      if model_styles is None or request['params']['model_style'] in model_styles]
+        if not candidates:
+            return None
+        eligible = [self.queue[i] for i in candidates]
+        choice = self.policy.select(eligible, self.loaded_models, self.skips, time.time())
+        if choice:
+            # The oldest eligible request would have forced a checkpoint swap; the chosen one
+            # only avoids it if its own model is loaded, not if it won by waiting too long
+            if eligible[choice]['params']['model_style'] in self.loaded_models:
+                self.swaps_avoided += 1
+                logger.info(f"Scheduled a '{eligible[choice]['params']['model_style']}' request ahead of "
+                            f"{choice} others to avoid a checkpoint swap (swaps avoided: {self.swaps_avoided})")
+            for request in eligible[:choice]:
+                self.skips[request['id']] = self.skips.get(request['id'], 0) + 1
+        request = eligible[choice]
+        del self.queue[candidates[choice]]
+        self.skips.pop(request['id'], None)
+        return request
+
+    def _take_compatible(self, batch, max_size):
+        key = batch_key(batch[0])
+        remaining = deque()
+        for request in self.queue:
+            if len(batch) < max_size and batch_key(request) == key:
+                batch.append(request)
+            else:
+                remaining.append(request)
+        for request in batch:
+            self.skips.pop(request['id'], None)
+        self.queue = remaining
+
+    def _projected_order(self):
+        """The order the scheduling policy will serve the currently queued requests in."""
+        if not self.loaded_models or isinstance(self.policy, FifoPolicy):
+            return list(self.queue)
+
+        pending = list(self.queue)
+        skips = dict(self.skips)
+        loaded_models = set(self.loaded_models)
+        now = time.time()
+        order = []
+        while pending:
+            index = self.policy.select(pending, loaded_models, skips, now)
+            for request in pending[:index]:
+                skips[request['id']] = skips.get(request['id'], 0) + 1
+            request = pending.pop(index)
+            order.append(request)
+            loaded_models.add(request['params']['model_style'])
+            now += config['queue']['estimated_generation_time'] / self.slots
+        return order
+
+    def _position_of(self, request_id):
+        if not self.loaded_models or isinstance(self.policy, FifoPolicy):
+            return self.registry.fifo_position(request_id)
+        for i, request in enumerate(self._projected_order()):
+            if request['id'] == request_id:
+                return i + 1
+        return None
 
 request_queue = RequestQueue()
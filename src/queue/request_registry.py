@@ -0,0 +1,119 @@
+import json
+import time
+import asyncio
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from ..utils.logging_config import logger
+from ..utils.sqlite_writer import BatchedSQLiteWriter
+from ..stats.database import get_db_connection, get_db_path
+
+QUEUED = 'queued'
+IN_FLIGHT = 'in_flight'
+COMPLETED = 'completed'
+
+class RequestRegistry:
+    """Index of every request the bot knows about, by id.
+
+    Queued and in-flight requests are always indexed. Completed requests are kept
+    in a bounded LRU history so Regenerate/Remix keep working after a job is done.
+    With ``spill_to_db``, every completion is also written through to SQLite by a
+    batched background writer, so requests evicted from memory or lost in a
+    restart are still found there.
+    FIFO queue positions come from a sorted list of arrival sequence numbers.
+    """
+
+    def __init__(self, max_history=1000, spill_to_db=False):
+        self.requests = {}
+        self.states = {}
+        self.history = OrderedDict()
+        self.max_history = max_history
+        self.spill_to_db = spill_to_db
+        self._writer = BatchedSQLiteWriter(get_db_path(), name='request-history') if spill_to_db else None
+        self._seq_of = {}
+        self._queued_seqs = []
+        self._next_seq = 0
+
+    def add_queued(self, request):
+        request_id = request['id']
+        if request_id not in self._seq_of:
+            self._seq_of[request_id] = self._next_seq
+            self._next_seq += 1
+        self.requests[request_id] = request
+        self._set_state(request_id, QUEUED)
+
+    def mark_in_flight(self, request):
+        self.requests[request['id']] = request
+        self._set_state(request['id'], IN_FLIGHT)
+
+    def complete(self, request):
+        request_id = request['id']
+        self._set_state(request_id, None)
+        self.requests.pop(request_id, None)
+        self._seq_of.pop(request_id, None)
+        self.history[request_id] = request
+        self.history.move_to_end(request_id)
+        while len(self.history) > self.max_history:
+            self.history.popitem(last=False)
+
+        if self._writer is not None:
+            # Started on first use, after init_db has created the table
+            self._writer.start()
+            self._writer.execute(
+                'INSERT OR REPLACE INTO request_history (id, payload, completed_at) VALUES (?, ?, ?)',
+                (request_id, json.dumps(request), time.time())
+            )
+
+    def close(self):
+        """Commit buffered history writes."""
+        if self._writer is not None:
+            self._writer.close()
+
+    def get(self, request_id):
+        """Return the request if it is queued, in flight or in the in-memory history."""
+        request = self.requests.get(request_id)
+        if request is None:
+            request = self.history.get(request_id)
+            if request is not None:
+                self.history.move_to_end(request_id)
+        return request
+
+    def state(self, request_id):
+        if request_id in self.states:
+            return self.states[request_id]
+        return COMPLETED if request_id in self.history else None
+
+    def fifo_position(self, request_id):
+        """1-based arrival-order position among queued requests, in O(log n)."""
+        if self.states.get(request_id) != QUEUED:
+            return None
+        return bisect_left(self._queued_seqs, self._seq_of[request_id]) + 1
+
+    async def lookup_spilled(self, request_id):
+        if not self.spill_to_db:
+            return None
+        return await asyncio.to_thread(_load_from_db, request_id)
+
+    def _set_state(self, request_id, state):
+        previous = self.states.pop(request_id, None)
+        seq = self._seq_of.get(request_id)
+        if previous == QUEUED:
+            index = bisect_left(self._queued_seqs, seq)
+            if index < len(self._queued_seqs) and self._queued_seqs[index] == seq:
+                del self._queued_seqs[index]
+        if state is not None:
+            self.states[request_id] = state
+            if state == QUEUED:
+                insort(self._queued_seqs, seq)
+
+def _load_from_db(request_id):
+    conn = None
+    try:
+        conn = get_db_connection()
+        row = conn.execute('SELECT payload FROM request_history WHERE id = ?', (request_id,)).fetchone()
+        return json.loads(row['payload']) if row else None
+    except Exception as e:
+        logger.error(f"Failed to look up request {request_id} in history: {str(e)}")
+        return None
+    finally:
+        if conn is not None:
+            conn.close()
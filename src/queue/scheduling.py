@@ -0,0 +1,40 @@
+from ..utils.exceptions import ConfigurationError
+
+class FifoPolicy:
+    """Serve requests strictly in arrival order."""
+
+    def select(self, requests, loaded_models, skips, now):
+        return 0
+
+class ModelAffinityPolicy:
+    """Prefer the oldest request whose checkpoint is already loaded.
+
+    A request may be passed over at most ``max_skips`` times or for at most
+    ``max_wait_seconds`` since it was queued; once either bound is reached it is
+    served next regardless of which model it needs.
+    """
+
+    def __init__(self, max_skips, max_wait_seconds):
+        self.max_skips = max_skips
+        self.max_wait_seconds = max_wait_seconds
+
+    def select(self, requests, loaded_models, skips, now):
+        for i, request in enumerate(requests):
+            if request['params']['model_style'] in loaded_models or self._is_due(request, skips, now):
+                return i
+        return 0
+
+    def _is_due(self, request, skips, now):
+        return (skips.get(request['id'], 0) >= self.max_skips
+                or now - request.get('queued_at', now) >= self.max_wait_seconds)
+
+def create_policy(scheduling_config):
+    policy = scheduling_config.get('policy', 'fifo')
+    if policy == 'fifo':
+        return FifoPolicy()
+    if policy == 'model_affinity':
+        return ModelAffinityPolicy(
+            scheduling_config.get('max_skips', 3),
+            scheduling_config.get('max_wait_seconds', 300),
+        )
+    raise ConfigurationError(f"Unknown queue scheduling policy: {policy}")
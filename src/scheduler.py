@@ -2,13 +2,16 @@ import asyncio
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from src.stats.reporter import generate_report_message
 from src.utils.config import load_config
-from src.bot.slack_interface import app
+from src.bot.slack_dispatcher import slack_dispatcher
 
 config = load_config()
 
 async def send_report(period):
+    if not config['slack'].get('report_channel'):
+        return
     message = await generate_report_message(period)
-    await app.client.chat_postMessage(
+    await slack_dispatcher.call(
+        'chat_postMessage',
         channel=config['slack']['report_channel'],
         text=message
     )
@@ -1,25 +1,31 @@
 import os
-import sqlite3
 from src.utils.config import load_config
 from src.utils.logging_config import logger
+from src.utils.sqlite_writer import connect
 
 config = load_config()
 
-def get_db_connection():
+# Per-day rollup table for each dimension of generation_events, kept current by the recorder
+ROLLUP_TABLES = {
+    'daily_model_counts': 'model_style',
+    'daily_aspect_counts': 'aspect_ratio',
+    'daily_user_counts': 'user_id',
+}
+
+def get_db_path():
     db_path = config['stats']['database_path']
     if not db_path:
         raise ValueError("Database path is not set in the configuration")
+    return db_path
 
-    db_dir = os.path.dirname(db_path)
-    os.makedirs(db_dir, exist_ok=True)
-
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_db_connection():
+    # The directory is created once by init_db, not on every connection
+    return connect(get_db_path())
 
 def init_db():
     conn = None
     try:
+        os.makedirs(os.path.dirname(get_db_path()) or '.', exist_ok=True)
         conn = get_db_connection()
         conn.execute('''
             CREATE TABLE IF NOT EXISTS generation_events (
@@ -30,6 +36,24 @@ def init_db():
                 aspect_ratio TEXT
             )
         ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_events_timestamp ON generation_events (timestamp)')
+        for table, column in ROLLUP_TABLES.items():
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    day TEXT NOT NULL,
+                    {column} TEXT,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, {column})
+                )
+            ''')
+        _backfill_rollups(conn)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS request_history (
+                id TEXT PRIMARY KEY,
+                payload TEXT,
+                completed_at REAL
+            )
+        ''')
         conn.commit()
         logger.info(f"Database initialized at {config['stats']['database_path']}")
     except Exception as e:
@@ -38,3 +62,27 @@ def init_db():
     finally:
         if conn is not None:
             conn.close()
+
+def rollup_upserts(day, values):
+    """Statements that count one event into each rollup table for ``day``."""
+    return [
+        (f'''
+            INSERT INTO {table} (day, {column}, count) VALUES (?, ?, 1)
+            ON CONFLICT (day, {column}) DO UPDATE SET count = count + 1
+        ''', (day, values[column]))
+        for table, column in ROLLUP_TABLES.items()
+    ]
+
+def _backfill_rollups(conn):
+    """Build the rollups from raw events once, for databases that predate them."""
+    if conn.execute('SELECT 1 FROM daily_model_counts LIMIT 1').fetchone():
+        return
+    if not conn.execute('SELECT 1 FROM generation_events LIMIT 1').fetchone():
+        return
+    for table, column in ROLLUP_TABLES.items():
+        conn.execute(f'''
+            INSERT INTO {table} (day, {column}, count)
+            SELECT DATE(timestamp), {column}, COUNT(*) FROM generation_events
+            GROUP BY DATE(timestamp), {column}
+        ''')
+    logger.info("Backfilled daily stats rollups from generation_events")
@@ -1,37 +1,92 @@
+import time
+import asyncio
+from collections import Counter
 from .database import get_db_connection
 from ..utils.config import load_config
 
 config = load_config()
 
-async def get_usage_stats(period):
+# How far back each report looks, as SQLite date modifiers relative to today
+PERIODS = {
+    'daily': None,
+    'weekly': '-7 days',
+    'monthly': '-1 month',
+    'yearly': '-1 year',
+}
+
+_cache = {'expires_at': 0, 'stats': None}
+_cache_lock = asyncio.Lock()
+
+def _compute_all_periods():
+    """Aggregate every report period in one pass over the daily rollups."""
     conn = get_db_connection()
-    if period == 'daily':
-        timeframe = "DATE(timestamp) = DATE('now')"
-    elif period == 'weekly':
-        timeframe = "DATE(timestamp) BETWEEN DATE('now', '-7 days') AND DATE('now')"
-    elif period == 'monthly':
-        timeframe = "DATE(timestamp) BETWEEN DATE('now', '-1 month') AND DATE('now')"
-    elif period == 'yearly':
-        timeframe = "DATE(timestamp) BETWEEN DATE('now', '-1 year') AND DATE('now')"
-    else:
-        raise ValueError("Invalid period")
+    try:
+        row = conn.execute(
+            'SELECT ' + ', '.join(
+                f"DATE('now', '{modifier}')" if modifier else "DATE('now')" for modifier in PERIODS.values()
+            )
+        ).fetchone()
+        starts = dict(zip(PERIODS, row))
+        earliest = min(starts.values())
+
+        models = conn.execute(
+            'SELECT day, model_style, count FROM daily_model_counts WHERE day >= ?', (earliest,)
+        ).fetchall()
+        aspects = conn.execute(
+            'SELECT day, aspect_ratio, count FROM daily_aspect_counts WHERE day >= ?', (earliest,)
+        ).fetchall()
+        users = conn.execute(
+            'SELECT day, user_id FROM daily_user_counts WHERE day >= ?', (earliest,)
+        ).fetchall()
+    finally:
+        conn.close()
 
-    cursor = conn.cursor()
-    cursor.execute(f'''
-        SELECT COUNT(*) as total_images,
-               COUNT(DISTINCT user_id) as unique_users,
-               MAX(model_style) as most_used_model
-        FROM generation_events
-        WHERE {timeframe}
-    ''')
-    stats = cursor.fetchone()
-    conn.close()
+    model_counts = {period: Counter() for period in PERIODS}
+    aspect_counts = {period: Counter() for period in PERIODS}
+    user_sets = {period: set() for period in PERIODS}
+    for day, model_style, count in models:
+        for period, start in starts.items():
+            if day >= start:
+                model_counts[period][model_style] += count
+    for day, aspect_ratio, count in aspects:
+        for period, start in starts.items():
+            if day >= start:
+                aspect_counts[period][aspect_ratio] += count
+    for day, user_id in users:
+        for period, start in starts.items():
+            if day >= start:
+                user_sets[period].add(user_id)
+
+    stats = {}
+    for period in PERIODS:
+        top_model = model_counts[period].most_common(1)
+        top_aspect = aspect_counts[period].most_common(1)
+        stats[period] = {
+            'total_images': sum(model_counts[period].values()),
+            'unique_users': len(user_sets[period]),
+            'most_used_model': top_model[0][0] if top_model else None,
+            'most_used_aspect_ratio': top_aspect[0][0] if top_aspect else None,
+        }
     return stats
 
+async def get_all_usage_stats():
+    """Stats for every period, recomputed off the event loop at most once per cache TTL."""
+    async with _cache_lock:
+        if _cache['stats'] is None or time.monotonic() >= _cache['expires_at']:
+            _cache['stats'] = await asyncio.to_thread(_compute_all_periods)
+            _cache['expires_at'] = time.monotonic() + config['stats'].get('report_cache_seconds', 60)
+        return _cache['stats']
+
+async def get_usage_stats(period):
+    if period not in PERIODS:
+        raise ValueError("Invalid period")
+    return (await get_all_usage_stats())[period]
+
 async def generate_report_message(period):
     stats = await get_usage_stats(period)
     return (f"📊 {period.capitalize()} Stats Report 📊\n"
             f"Total images generated: {stats['total_images']}\n"
             f"Unique users: {stats['unique_users']}\n"
             f"Most used model: {stats['most_used_model']}\n"
+            f"Most used aspect ratio: {stats['most_used_aspect_ratio']}\n"
             f"Keep those creative juices flowing! 🎨✨")
@@ -1,10 +1,42 @@
-from .database import get_db_connection
-
-async def record_generation_event(user_id, model_style, aspect_ratio):
-    conn = get_db_connection()
-    conn.execute('''
-        INSERT INTO generation_events (user_id, model_style, aspect_ratio)
-        VALUES (?, ?, ?)
-    ''', (user_id, model_style, aspect_ratio))
-    conn.commit()
-    conn.close()
+from datetime import datetime, timezone
+from src.utils.config import load_config
+from src.utils.sqlite_writer import BatchedSQLiteWriter
+from .database import get_db_path, rollup_upserts
+
+config = load_config()
+
+class StatsRecorder:
+    """Write-behind recorder for generation events.
+
+    Recording only appends to an in-memory buffer; a background thread with one
+    long-lived WAL connection inserts the buffered events in batches. Each event
+    also bumps the per-day rollups in the same transaction. ``close()`` flushes
+    whatever is still buffered.
+    """
+
+    def __init__(self, db_path: str, max_batch: int = 200, flush_interval: float = 1.0):
+        self.writer = BatchedSQLiteWriter(db_path, name='stats-recorder',
+                                          max_batch=max_batch, flush_interval=flush_interval)
+
+    def start(self) -> None:
+        self.writer.start()
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def record_generation_event(self, user_id, model_style, aspect_ratio) -> None:
+        # Stamp the event now rather than at commit time, in CURRENT_TIMESTAMP's format
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self.writer.execute('''
+            INSERT INTO generation_events (timestamp, user_id, model_style, aspect_ratio)
+            VALUES (?, ?, ?, ?)
+        ''', (timestamp, user_id, model_style, aspect_ratio))
+        values = {'user_id': user_id, 'model_style': model_style, 'aspect_ratio': aspect_ratio}
+        for sql, params in rollup_upserts(timestamp[:10], values):
+            self.writer.execute(sql, params)
+
+stats_recorder = StatsRecorder(
+    get_db_path(),
+    max_batch=config['stats'].get('max_batch', 200),
+    flush_interval=config['stats'].get('flush_interval', 1.0),
+)
@@ -1,25 +1,192 @@
-import yaml
 import os
+import re
+import logging
+import threading
+from collections.abc import Mapping
 from pathlib import Path
+import yaml
+from .exceptions import ConfigurationError
+
+CONFIG_PATH = Path(__file__).parent.parent.parent / 'config' / 'config.yaml'
+BASE_DIR = str(CONFIG_PATH.parent.parent)
+
+# ${VAR} or ${VAR:default}; the default may be empty but not contain '}'
+_ENV_PATTERN = re.compile(r'\$\{([A-Za-z_][A-Za-z0-9_]*)(?::([^}]*))?\}')
+
+# Settings every deployment must provide, as (path, expected type)
+SCHEMA = [
+    (('slack', 'bot_token'), str),
+    (('slack', 'app_token'), str),
+    (('stats', 'database_path'), str),
+    (('stable_diffusion', 'comfyui_path'), str),
+    (('stable_diffusion', 'output_path'), str),
+    (('stable_diffusion', 'default_reference_path'), str),
+    (('stable_diffusion', 'models'), Mapping),
+    (('image_generation', 'allowed_extensions'), tuple),
+    (('image_generation', 'default_negative_prompt'), str),
+    (('queue', 'estimated_generation_time'), (int, float)),
+    (('logging', 'level'), str),
+    (('logging', 'format'), str),
+]
+
+class FrozenConfig(Mapping):
+    """Read-only view of a parsed config section; lists are exposed as tuples."""
+
+    def __init__(self, data: dict):
+        self._data = {key: _freeze(value) for key, value in data.items()}
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"FrozenConfig({self._data!r})"
+
+class ConfigProxy(Mapping):
+    """The process-wide config: parsed and validated once, swapped atomically on reload.
+
+    Modules keep the object returned by ``load_config()``; every lookup goes to
+    the current snapshot, so values read at use time pick up edits to the file.
+    Values captured at import time (cache sizes, worker layout) still need a restart.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._snapshot = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def __getitem__(self, key):
+        return self._current()[key]
+
+    def __iter__(self):
+        return iter(self._current())
 
-def load_config():
-    config_path = Path(__file__).parent.parent.parent / 'config' / 'config.yaml'
-    with open(config_path, 'r') as file:
-        config = yaml.safe_load(file)
+    def __len__(self):
+        return len(self._current())
 
-    # Replace environment variables
-    for category in config:
-        if isinstance(config[category], dict):
-            for key, value in config[category].items():
-                if isinstance(value, str) and value.startswith('${') and value.endswith('}'):
-                    env_var = value[2:-1]
-                    config[category][key] = os.environ.get(env_var, value)
+    def add_reload_listener(self, callback) -> None:
+        """Register ``callback()`` to run (on the watcher thread) after each successful reload."""
+        self._listeners.append(callback)
 
+    def reload(self) -> bool:
+        """Re-read the file; keep the current snapshot if the new one fails to parse or validate."""
+        mtime = None
+        try:
+            mtime = os.path.getmtime(self.path)
+            snapshot = _parse(self.path)
+        except (OSError, yaml.YAMLError, ConfigurationError) as e:
+            # Remember the broken version so the watcher doesn't retry it every poll
+            if mtime is not None:
+                self._mtime = mtime
+            logging.getLogger(__name__).error(f"Config reload failed, keeping previous settings: {str(e)}")
+            return False
+        with self._lock:
+            self._snapshot = snapshot
+            self._mtime = mtime
+        logging.getLogger(__name__).info(f"Config reloaded from {self.path}")
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Config reload listener failed: {str(e)}")
+        return True
+
+    def start_watching(self, interval: float = 5.0) -> None:
+        """Poll the file's mtime on a daemon thread and reload when it changes."""
+        if self._watcher is not None:
+            return
+        self._current()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='config-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if mtime != self._mtime:
+                self.reload()
+
+    def _current(self) -> FrozenConfig:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._mtime = os.path.getmtime(self.path)
+                    self._snapshot = _parse(self.path)
+                snapshot = self._snapshot
+        return snapshot
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenConfig(value)
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _substitute_env(value):
+    """Expand ${VAR} and ${VAR:default} anywhere in the parsed YAML."""
+    if isinstance(value, dict):
+        return {key: _substitute_env(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute_env(item) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def replace(match):
+        name, default = match.group(1), match.group(2)
+        if name in os.environ:
+            return os.environ[name]
+        if default is None:
+            raise ConfigurationError(f"Environment variable {name} is not set and has no default")
+        return default
+
+    return _ENV_PATTERN.sub(replace, value)
+
+def _validate(config: FrozenConfig) -> None:
+    for path, expected in SCHEMA:
+        value = config
+        for key in path:
+            if not isinstance(value, Mapping) or key not in value:
+                raise ConfigurationError(f"Missing required setting {'.'.join(path)}")
+            value = value[key]
+        if not isinstance(value, expected) or (isinstance(value, str) and not value):
+            raise ConfigurationError(f"Setting {'.'.join(path)} must be a non-empty {getattr(expected, '__name__', expected)}")
+
+def _parse(path: Path) -> FrozenConfig:
+    with open(path, 'r') as file:
+        raw = yaml.safe_load(file) or {}
+
+    raw = _substitute_env(raw)
     # Add a custom temp directory
-    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    config['temp_dir'] = os.path.join(base_dir, 'temp')
+    raw['temp_dir'] = os.path.join(BASE_DIR, 'temp')
+
+    config = FrozenConfig(raw)
+    _validate(config)
 
     # Ensure the temp directory exists
     os.makedirs(config['temp_dir'], exist_ok=True)
-
     return config
+
+_config = ConfigProxy(CONFIG_PATH)
+
+def load_config() -> ConfigProxy:
+    """Return the shared config; the file is parsed on first use only."""
+    return _config
+
+def data_file_path(filename: str, override: str = None) -> str:
+    """``override`` if set, otherwise ``filename`` in the directory holding the stats database."""
+    return override or os.path.join(os.path.dirname(_config['stats']['database_path']), filename)
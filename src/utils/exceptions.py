@@ -12,3 +12,6 @@ class SlackAPIError(SDSlackBotError):
 
 class QueueError(SDSlackBotError):
     """Raised when there's an issue with the request queue"""
+
+class DownloadError(SDSlackBotError):
+    """Raised when a file can't be downloaded"""
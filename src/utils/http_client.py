@@ -0,0 +1,106 @@
+import os
+import random
+import asyncio
+import aiohttp
+from .config import load_config
+from .logging_config import logger
+from .exceptions import DownloadError
+
+config = load_config()
+
+CHUNK_SIZE = 256 * 1024
+
+class _RetryableError(Exception):
+    pass
+
+class HttpClient:
+    """One connection-pooled aiohttp session shared for the bot's lifetime.
+
+    ``download()`` streams the body to disk in chunks, writing from a worker
+    thread so large files never sit in memory or block the event loop. It
+    enforces a byte limit (up front from Content-Length, and while streaming) and
+    retries transient failures with jittered exponential backoff.
+    """
+
+    def __init__(self, max_connections: int = 20, timeout_seconds: float = 30, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8):
+        self.max_connections = max_connections
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+                # No total limit: large bodies are fine as long as bytes keep arriving
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout_seconds, sock_read=self.timeout_seconds),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def download(self, url: str, local_filename: str, headers: dict = None,
+                       max_bytes: int = None, content_type: str = None) -> int:
+        """Stream ``url`` to ``local_filename`` and return the number of bytes written."""
+        for attempt in range(self.max_retries):
+            try:
+                return await self._download_once(url, local_filename, headers, max_bytes, content_type)
+            except (_RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries - 1:
+                    raise DownloadError(f"Download failed after {self.max_retries} attempts: {str(e)}")
+                # Full jitter keeps concurrent retries from arriving in lockstep
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                logger.warning(f"Download attempt {attempt + 1}/{self.max_retries} failed: {str(e)}. "
+                               f"Retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _download_once(self, url, local_filename, headers, max_bytes, content_type) -> int:
+        async with self.session().get(url, headers=headers) as response:
+            logger.debug(f"Download status {response.status}, headers: {dict(response.headers)}")
+
+            if response.status == 429 or response.status >= 500:
+                raise _RetryableError(f"status code {response.status}")
+            if response.status != 200:
+                raise DownloadError(f"Unexpected status code {response.status}")
+
+            if content_type and content_type not in response.headers.get('Content-Type', ''):
+                raise DownloadError(f"Unexpected content type: {response.headers.get('Content-Type')}")
+
+            if max_bytes is not None and response.content_length is not None and response.content_length > max_bytes:
+                raise DownloadError(f"File is {response.content_length} bytes, the limit is {max_bytes}")
+
+            written = 0
+            f = await asyncio.to_thread(open, local_filename, 'wb')
+            try:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    written += len(chunk)
+                    if max_bytes is not None and written > max_bytes:
+                        raise DownloadError(f"File exceeds the limit of {max_bytes} bytes")
+                    await asyncio.to_thread(f.write, chunk)
+            except BaseException:
+                await asyncio.to_thread(f.close)
+                await asyncio.to_thread(_remove_quietly, local_filename)
+                raise
+            await asyncio.to_thread(f.close)
+            return written
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+_http_config = config.get('http', {})
+http_client = HttpClient(
+    max_connections=_http_config.get('max_connections', 20),
+    timeout_seconds=_http_config.get('timeout_seconds', 30),
+    max_retries=_http_config.get('max_retries', 3),
+    backoff_base=_http_config.get('backoff_base_seconds', 0.5),
+    backoff_max=_http_config.get('backoff_max_seconds', 8),
+)
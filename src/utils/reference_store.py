@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from .config import load_config
+from .logging_config import logger
+from .temp_dir_manager import temp_dir_manager
+
+config = load_config()
+
+class ReferenceStore:
+    """Content-addressed store for reference images uploaded through Slack.
+
+    Each distinct image is kept once, as ``<sha256><ext>`` under ``root``. Slack
+    file ids map to content hashes, so attaching the same file again skips
+    ``files_info`` and the download. Blobs are reference counted: every queued
+    request holds one reference from submission until it completes, and
+    ``sweep()`` only removes blobs nobody holds that have been idle for
+    ``max_idle_seconds``.
+    """
+
+    def __init__(self, root: str, max_idle_seconds: float = 86400):
+        self.root = root
+        self.max_idle_seconds = max_idle_seconds
+        os.makedirs(root, exist_ok=True)
+        self._file_hashes = {}
+        self._blobs = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._removal_listeners = []
+        self._load_existing()
+
+    def _load_existing(self) -> None:
+        # Blobs from a previous run stay usable by requests recovered from the journal. Their
+        # mtime is the original download time, so idleness is counted from now instead
+        loaded_at = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isfile(path):
+                self._blobs[path] = {'refs': 0, 'last_used': loaded_at}
+
+    def add_removal_listener(self, callback) -> None:
+        """Register ``callback(path)``, called after a blob is deleted by ``sweep()``."""
+        self._removal_listeners.append(callback)
+
+    async def fetch(self, file_id: str, download) -> str:
+        """Return the blob path for a Slack file, holding one reference to it.
+
+        ``download()`` is awaited only on a miss; it must save the file somewhere
+        and return that path, pinned in the temp dir manager. The store takes
+        ownership of the file and releases the pin once it has moved it.
+        """
+        path = self._lookup(file_id)
+        if path is None:
+            # Concurrent submissions of the same file share one download
+            pending = self._pending.get(file_id)
+            if pending is None:
+                pending = asyncio.ensure_future(self._ingest(file_id, download))
+                self._pending[file_id] = pending
+                pending.add_done_callback(lambda _: self._pending.pop(file_id, None))
+            path = await asyncio.shield(pending)
+        else:
+            logger.info(f"Reference image for Slack file {file_id} served from the store")
+
+        self.acquire(path)
+        return path
+
+    def acquire(self, path: str) -> None:
+        """Take a reference; paths outside the store (e.g. the default reference) are ignored."""
+        with self._lock:
+            blob = self._blobs.get(path)
+            if blob is not None:
+                blob['refs'] += 1
+                blob['last_used'] = time.time()
+
+    def release(self, path: str) -> None:
+        with self._lock:
+            blob = self._blobs.get(path)
+            if blob is not None and blob['refs'] > 0:
+                blob['refs'] -= 1
+                blob['last_used'] = time.time()
+
+    def sweep(self) -> int:
+        """Delete unreferenced blobs idle for longer than ``max_idle_seconds``. Blocking."""
+        cutoff = time.time() - self.max_idle_seconds
+        with self._lock:
+            expired = [path for path, blob in self._blobs.items()
+                       if blob['refs'] == 0 and blob['last_used'] < cutoff]
+            for path in expired:
+                del self._blobs[path]
+            stale_ids = [file_id for file_id, path in self._file_hashes.items() if path in expired]
+            for file_id in stale_ids:
+                del self._file_hashes[file_id]
+
+        for path in expired:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove reference blob {path}: {str(e)}")
+            for callback in self._removal_listeners:
+                callback(path)
+        if expired:
+            logger.info(f"Removed {len(expired)} unused reference image(s)")
+        return len(expired)
+
+    def _lookup(self, file_id: str):
+        with self._lock:
+            path = self._file_hashes.get(file_id)
+            if path is not None and path in self._blobs and os.path.exists(path):
+                return path
+        return None
+
+    async def _ingest(self, file_id: str, download) -> str:
+        downloaded_path = await download()
+        try:
+            path = await asyncio.to_thread(self._store_blob, downloaded_path)
+        finally:
+            # The download stays pinned until it has been moved into the store
+            temp_dir_manager.unpin(downloaded_path)
+        with self._lock:
+            self._blobs.setdefault(path, {'refs': 0, 'last_used': time.time()})
+            self._file_hashes[file_id] = path
+        return path
+
+    def _store_blob(self, downloaded_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(downloaded_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        extension = os.path.splitext(downloaded_path)[1].lower()
+        path = os.path.join(self.root, f"{digest.hexdigest()}{extension}")
+
+        if os.path.exists(path):
+            # Same bytes uploaded as a different Slack file
+            os.remove(downloaded_path)
+        else:
+            os.replace(downloaded_path, path)
+        temp_dir_manager.forget(downloaded_path)
+        return path
+
+reference_store = ReferenceStore(
+    os.path.join(config['temp_dir'], 'references'),
+    config['image_generation'].get('reference_max_idle_seconds', 86400),
+)
@@ -0,0 +1,93 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from src.utils.logging_config import logger
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open a connection tuned for many small writes: WAL journal, NORMAL sync."""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class BatchedSQLiteWriter:
+    """Write-behind SQLite writer with one long-lived connection on a background thread.
+
+    ``execute()`` only appends to an in-memory buffer. The thread groups buffered
+    statements into a single transaction, committing once ``max_batch`` statements
+    are pending or ``flush_interval`` seconds after the first one arrived.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path: str, name: str, max_batch: int = 100, flush_interval: float = 0.05):
+        self.db_path = db_path
+        self.name = name
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._buffer = queue.Queue()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def execute(self, sql: str, params=()) -> None:
+        self._buffer.put((sql, params))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until everything buffered so far is committed."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._buffer.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = None) -> None:
+        """Commit whatever is buffered and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._buffer.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        conn = connect(self.db_path)
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self._buffer.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.max_batch and batch[-1] is not self._STOP:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._buffer.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                statements = [item for item in batch if isinstance(item, tuple)]
+                if statements:
+                    self._commit(conn, statements)
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                    elif item is self._STOP:
+                        stopping = True
+        finally:
+            conn.close()
+
+    def _commit(self, conn, statements) -> None:
+        try:
+            with conn:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+        except Exception as e:
+            logger.error(f"{self.name}: failed to commit {len(statements)} buffered writes: {str(e)}")
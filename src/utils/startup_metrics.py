@@ -0,0 +1,17 @@
+import time
+from .logging_config import logger
+
+# Taken when main imports this module, before the bot or the backend start loading
+PROCESS_START = time.monotonic()
+
+_events = {}
+
+def record_startup_event(name: str) -> None:
+    """Log the time from process start to the first occurrence of ``name``."""
+    if name in _events:
+        return
+    _events[name] = time.monotonic() - PROCESS_START
+    logger.info(f"Startup timing: {name} after {_events[name]:.3f}s")
+
+def startup_timings() -> dict:
+    return dict(_events)
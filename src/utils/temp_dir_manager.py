@@ -1,28 +1,163 @@
 import os
 import time
-import shutil
+import heapq
+import threading
 from src.utils.logging_config import logger
 from src.utils.config import load_config
 
 config = load_config()
 
 class TempDirManager:
-    def __init__(self):
+    """Hands out temp file paths and removes them once they expire.
+
+    Every path handed out (or found on disk at startup) goes into an in-memory
+    heap ordered by expiry, so a sweep only touches expired entries instead of
+    listing the directory. Sweeps handle at most ``batch_size`` expired entries
+    and are meant to run in a worker thread. Sizes are recorded as files are
+    tracked and kept as a running total; when it exceeds ``quota_bytes``, the
+    oldest files are evicted first. Pinned paths are never deleted.
+    """
+
+    def __init__(self, max_age_seconds: float = 3600, quota_bytes: int = None, batch_size: int = 500):
         self.base_temp_dir = os.path.join(config['temp_dir'], 'sd_bot_temp')
+        self.max_age_seconds = max_age_seconds
+        self.quota_bytes = quota_bytes
+        self.batch_size = batch_size
+        self._heap = []
+        self._expiry = {}
+        self._sizes = {}
+        self._usage = 0
+        self._pins = {}
+        self._lock = threading.Lock()
         os.makedirs(self.base_temp_dir, exist_ok=True)
         logger.info(f"Created base temporary directory: {self.base_temp_dir}")
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        # The only full directory scan: pick up files left by a previous run
+        with os.scandir(self.base_temp_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    self._track(entry.path, stat.st_mtime + self.max_age_seconds, stat.st_size)
+        if self._expiry:
+            logger.info(f"Tracking {len(self._expiry)} existing temporary file(s)")
+
+    def get_temp_file_path(self, filename, max_age_seconds=None):
+        path = os.path.join(self.base_temp_dir, f"{time.time()}_{filename}")
+        self.track(path, max_age_seconds, size=0)
+        return path
+
+    def track(self, path, max_age_seconds=None, size=None) -> None:
+        """Expire ``path`` after ``max_age_seconds`` (the manager default if None).
+
+        ``size`` defaults to the file's current size; call ``set_size()`` once a
+        file handed out before it was written is complete.
+        """
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+        age = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        self._track(path, time.time() + age, size)
+
+    def set_size(self, path, size) -> None:
+        with self._lock:
+            if path in self._expiry:
+                self._usage += size - self._sizes.get(path, 0)
+                self._sizes[path] = size
+
+    def forget(self, path) -> None:
+        """Stop tracking a file that was moved elsewhere or deleted by its owner."""
+        with self._lock:
+            self._untrack_locked(path)
+
+    def pin(self, path) -> None:
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+
+    def unpin(self, path) -> None:
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+            else:
+                self._pins.pop(path, None)
+
+    def sweep(self) -> int:
+        """Remove up to ``batch_size`` expired files, then enforce the quota. Blocking."""
+        now = time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(expired) < self.batch_size:
+                expires_at, path = heapq.heappop(self._heap)
+                if self._expiry.get(path) != expires_at:
+                    continue  # forgotten or re-tracked since
+                if path in self._pins:
+                    # Still in use; look again after another full period
+                    self._track_locked(path, now + self.max_age_seconds)
+                    continue
+                self._untrack_locked(path)
+                expired.append(path)
+
+        removed = sum(self._remove(path) for path in expired)
+        if self.quota_bytes is not None:
+            removed += self._enforce_quota()
+        if removed:
+            logger.info(f"Removed {removed} temporary file(s)")
+        return removed
+
+    def _enforce_quota(self) -> int:
+        with self._lock:
+            if self._usage <= self.quota_bytes:
+                return 0
+            # Oldest first; expiry order equals creation order for a fixed max age
+            candidates = sorted((expires_at, path) for path, expires_at in self._expiry.items()
+                                if path not in self._pins)
+            usage = self._usage
+            victims = []
+            for _, path in candidates:
+                if usage <= self.quota_bytes:
+                    break
+                usage -= self._sizes.get(path, 0)
+                self._untrack_locked(path)
+                victims.append(path)
+
+        removed = sum(self._remove(path) for path in victims)
+        if usage > self.quota_bytes:
+            logger.warning(f"Temporary files use {usage} bytes, over the {self.quota_bytes} byte quota, "
+                           f"but the rest are pinned")
+        return removed
+
+    def _remove(self, path) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"Failed to remove temporary file {path}: {str(e)}")
+            return False
+
+    def _track(self, path, expires_at, size) -> None:
+        with self._lock:
+            self._usage += size - self._sizes.get(path, 0)
+            self._sizes[path] = size
+            self._track_locked(path, expires_at)
 
-    def get_temp_file_path(self, filename):
-        return os.path.join(self.base_temp_dir, f"{time.time()}_{filename}")
+    def _track_locked(self, path, expires_at) -> None:
+        self._expiry[path] = expires_at
+        heapq.heappush(self._heap, (expires_at, path))
 
-    def cleanup_old_files(self, max_age_hours=1):
-        current_time = time.time()
-        for filename in os.listdir(self.base_temp_dir):
-            file_path = os.path.join(self.base_temp_dir, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getctime(file_path)
-                if file_age > (max_age_hours * 3600):
-                    os.remove(file_path)
-                    logger.info(f"Removed old temporary file: {file_path}")
+    def _untrack_locked(self, path) -> None:
+        # Stale heap entries are skipped when popped
+        if self._expiry.pop(path, None) is not None:
+            self._usage -= self._sizes.pop(path, 0)
 
-temp_dir_manager = TempDirManager()
+_temp_config = config.get('temp', {})
+temp_dir_manager = TempDirManager(
+    max_age_seconds=_temp_config.get('max_age_seconds', 3600),
+    quota_bytes=_temp_config.get('quota_bytes'),
+    batch_size=_temp_config.get('sweep_batch_size', 500),
+)
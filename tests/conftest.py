@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# The config file requires these; tests never talk to Slack
+os.environ.setdefault('SLACK_BOT_TOKEN', 'xoxb-test')
+os.environ.setdefault('SLACK_APP_TOKEN', 'xapp-test')
+# Keep the stats database, and the queue/history databases next to it, out of the deployment path
+os.environ.setdefault('STATS_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='sd-bot-tests-'), 'stats.db'))
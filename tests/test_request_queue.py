@@ -0,0 +1,151 @@
+import time
+import asyncio
+from src.stats.database import init_db
+from src.queue.journal import QueueJournal
+from src.queue.request_queue import RequestQueue
+from src.queue.request_registry import COMPLETED
+from src.queue.scheduling import ModelAffinityPolicy
+from src.utils.sqlite_writer import connect
+
+def make_request(request_id, model_style='realistic', queued_at=None):
+    request = {
+        'id': request_id,
+        'user_id': 'U1',
+        'channel': 'C1',
+        'params': {
+            'model_style': model_style,
+            'width': 1024,
+            'height': 1024,
+            'reference_image_path': 'reference.png',
+            'reference_weight': 0.5,
+            'positive_prompt': f"prompt {request_id}",
+            'negative_prompt': '',
+        },
+    }
+    if queued_at is not None:
+        request['queued_at'] = queued_at
+    return request
+
+def journaled_queue(db_path):
+    queue = RequestQueue()
+    queue.journal = QueueJournal(str(db_path))
+    return queue
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_recover_requeues_queued_and_in_flight_requests(tmp_path):
+    db_path = tmp_path / 'queue.db'
+
+    async def before_crash():
+        queue = journaled_queue(db_path)
+        await queue.recover()
+        for request_id in ('a', 'b', 'c', 'd'):
+            await queue.add_request(make_request(request_id))
+        in_flight = await queue.get_next_batch()
+        finished = await queue.get_next_batch()
+        await queue.complete_requests(finished)
+        # Process dies with 'a' still generating; only what the journal committed survives
+        queue.journal.writer.flush()
+        return in_flight, finished
+
+    async def after_restart():
+        queue = journaled_queue(db_path)
+        recovered = await queue.recover()
+        batch = await queue.get_next_batch()
+        await queue.close_storage()
+        return recovered, [request['id'] for request in queue.queued_requests()], batch
+
+    in_flight, finished = run(before_crash())
+    assert [request['id'] for request in in_flight] == ['a']
+    assert [request['id'] for request in finished] == ['b']
+
+    recovered, still_queued, batch = run(after_restart())
+    # The interrupted request comes back first, the completed one not at all
+    assert recovered == 3
+    assert [request['id'] for request in batch] == ['a']
+    assert still_queued == ['c', 'd']
+
+def test_journal_prunes_completed_rows_while_running(tmp_path):
+    journal = QueueJournal(str(tmp_path / 'queue.db'), retention_seconds=0.1, prune_interval=0)
+    journal.open()
+    try:
+        for request_id in ('a', 'b'):
+            journal.record_queued(make_request(request_id))
+        journal.record_in_flight(make_request('a'))
+        journal.record_completed(make_request('a'))
+        time.sleep(0.2)
+        # The next completion prunes 'a', now past retention, without waiting for a restart
+        journal.record_completed(make_request('b'))
+        journal.writer.flush()
+    finally:
+        journal.close()
+
+    conn = connect(str(tmp_path / 'queue.db'))
+    try:
+        rows = conn.execute('SELECT id, state FROM queue_journal').fetchall()
+    finally:
+        conn.close()
+    assert [(row['id'], row['state']) for row in rows] == [('b', COMPLETED)]
+
+def test_completed_request_is_found_after_restart(tmp_path):
+    init_db()
+
+    async def before_restart():
+        queue = journaled_queue(tmp_path / 'queue.db')
+        await queue.recover()
+        await queue.add_request(make_request('done'))
+        await queue.complete_requests(await queue.get_next_batch())
+        await queue.close_storage()
+
+    async def after_restart():
+        queue = journaled_queue(tmp_path / 'queue.db')
+        await queue.recover()
+        request = await queue.get_request_by_id('done')
+        await queue.close_storage()
+        return request
+
+    run(before_restart())
+    request = run(after_restart())
+    assert request is not None
+    assert request['params']['positive_prompt'] == 'prompt done'
+
+def affinity_queue(requests, max_skips=2, max_wait_seconds=300):
+    queue = RequestQueue()
+    queue.journal = None
+    queue.policy = ModelAffinityPolicy(max_skips, max_wait_seconds)
+    for request in requests:
+        queue.queue.append(request)
+        queue.registry.add_queued(request)
+    queue.set_loaded_models({'realistic'})
+    return queue
+
+def pop_all(queue):
+    order = []
+    while queue.queue:
+        request = queue._pop_next()
+        order.append(request['id'])
+        # The request's checkpoint is resident once it has been generated
+        queue.set_loaded_models(queue.loaded_models | {request['params']['model_style']})
+    return order
+
+def test_affinity_skips_a_request_at_most_max_skips_times():
+    requests = [make_request('anime', model_style='anime')]
+    requests += [make_request(f"r{i}") for i in range(5)]
+    queue = affinity_queue(requests, max_skips=2)
+
+    projected = [request['id'] for request in queue.queued_requests()]
+    assert projected == ['r0', 'r1', 'anime', 'r2', 'r3', 'r4']
+    assert pop_all(queue) == projected
+    assert queue.swaps_avoided == 2
+
+def test_affinity_serves_a_request_past_max_wait_next():
+    now = time.time()
+    requests = [make_request('anime', model_style='anime', queued_at=now - 400)]
+    requests += [make_request(f"r{i}", queued_at=now) for i in range(3)]
+    queue = affinity_queue(requests, max_skips=10, max_wait_seconds=300)
+
+    assert [request['id'] for request in queue.queued_requests()][0] == 'anime'
+    assert pop_all(queue) == ['anime', 'r0', 'r1', 'r2']
+    # It forced a swap, so it doesn't count as one avoided
+    assert queue.swaps_avoided == 0
@@ -0,0 +1,148 @@
+import time
+import asyncio
+from types import SimpleNamespace
+from src.bot.slack_dispatcher import (
+    SlackDispatcher, PRIORITY_INTERACTIVE, PRIORITY_DELIVERY, PRIORITY_NOTIFY, PRIORITY_STATUS,
+)
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__('ratelimited')
+        self.response = SimpleNamespace(status_code=429, headers={'Retry-After': str(retry_after)})
+
+class FakeSlackClient:
+    """Records every Web API call and raises a 429 for the calls listed in ``rate_limits``."""
+
+    def __init__(self, latency=0.01, rate_limits=None):
+        self.latency = latency
+        self.rate_limits = dict(rate_limits or {})
+        self.calls = []
+        self.started = time.monotonic()
+
+    def __getattr__(self, method):
+        async def invoke(**kwargs):
+            self.calls.append((method, kwargs.get('tag'), time.monotonic() - self.started))
+            await asyncio.sleep(self.latency)
+            retry_after = self.rate_limits.pop((method, kwargs.get('tag')), None)
+            if retry_after is not None:
+                raise RateLimited(retry_after)
+            return {'ok': True, 'tag': kwargs.get('tag')}
+        return invoke
+
+    def times(self, method, tag):
+        return [at for called, called_tag, at in self.calls if (called, called_tag) == (method, tag)]
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_retries_after_retry_after():
+    async def scenario():
+        client = FakeSlackClient(rate_limits={('chat_postMessage', 'a'): 0.3})
+        dispatcher = SlackDispatcher()
+        dispatcher.bind(client)
+        try:
+            response = await dispatcher.call('chat_postMessage', tag='a')
+        finally:
+            await dispatcher.close()
+        return client, response
+
+    client, response = run(scenario())
+    assert response['tag'] == 'a'
+    first, second = client.times('chat_postMessage', 'a')
+    assert second - first >= 0.3
+
+def test_gives_up_after_max_retries():
+    async def scenario():
+        client = FakeSlackClient()
+        client.rate_limits = _AlwaysLimited(0.01)
+        dispatcher = SlackDispatcher(max_retries=2)
+        dispatcher.bind(client)
+        try:
+            await dispatcher.call('chat_postMessage', tag='a')
+        except RateLimited:
+            return client
+        finally:
+            await dispatcher.close()
+        raise AssertionError('expected the 429 to be raised')
+
+    client = run(scenario())
+    assert len(client.times('chat_postMessage', 'a')) == 3
+
+class _AlwaysLimited(dict):
+    def __init__(self, retry_after):
+        super().__init__()
+        self.retry_after = retry_after
+
+    def pop(self, key, default=None):
+        return self.retry_after
+
+def test_paused_method_does_not_hold_up_interactive_calls():
+    async def scenario():
+        client = FakeSlackClient(rate_limits={('chat_update', 0): 5})
+        dispatcher = SlackDispatcher(max_concurrency=2)
+        dispatcher.bind(client)
+        edits = [asyncio.ensure_future(dispatcher.call('chat_update', priority=PRIORITY_STATUS, tag=i))
+                 for i in range(12)]
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        await dispatcher.call('views_open', priority=PRIORITY_INTERACTIVE, tag='modal')
+        elapsed = time.monotonic() - started
+        await dispatcher.close()
+        await asyncio.gather(*edits, return_exceptions=True)
+        return elapsed
+
+    # Well inside the 3 second trigger_id lifetime, not after the 5 second Retry-After
+    assert run(scenario()) < 0.5
+
+def test_throttled_method_does_not_hold_up_deliveries():
+    async def scenario():
+        client = FakeSlackClient(latency=0.05)
+        dispatcher = SlackDispatcher(max_concurrency=2, burst=5)
+        dispatcher.bind(client)
+        edits = [asyncio.ensure_future(dispatcher.call('chat_update', priority=PRIORITY_STATUS, tag=i))
+                 for i in range(20)]
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await dispatcher.call('chat_postMessage', priority=PRIORITY_DELIVERY, tag='image')
+        elapsed = time.monotonic() - started
+        await dispatcher.close()
+        await asyncio.gather(*edits, return_exceptions=True)
+        return elapsed
+
+    # Only the burst of edits can run ahead of the delivery; the rest wait for tokens without a sender
+    assert run(scenario()) < 0.3
+
+def test_serves_queued_calls_in_priority_order():
+    async def scenario():
+        client = FakeSlackClient(latency=0.02)
+        dispatcher = SlackDispatcher(max_concurrency=1, burst=10)
+        dispatcher.bind(client)
+        # The first call occupies the only sender while the rest queue up
+        calls = [asyncio.ensure_future(dispatcher.call('chat_postMessage', priority=PRIORITY_NOTIFY, tag='busy'))]
+        await asyncio.sleep(0)
+        for priority, tag in [(PRIORITY_STATUS, 'status'), (PRIORITY_NOTIFY, 'notify'),
+                              (PRIORITY_DELIVERY, 'delivery'), (PRIORITY_INTERACTIVE, 'modal')]:
+            calls.append(asyncio.ensure_future(dispatcher.call('chat_postMessage', priority=priority, tag=tag)))
+        await asyncio.gather(*calls)
+        await dispatcher.close()
+        return [tag for _, tag, _ in client.calls]
+
+    assert run(scenario()) == ['busy', 'modal', 'delivery', 'notify', 'status']
+
+def test_retry_keeps_priority_over_later_calls_of_the_same_method():
+    async def scenario():
+        client = FakeSlackClient(rate_limits={('chat_update', 'first'): 0.2})
+        dispatcher = SlackDispatcher(max_concurrency=1)
+        dispatcher.bind(client)
+        first = asyncio.ensure_future(dispatcher.call('chat_update', priority=PRIORITY_DELIVERY, tag='first'))
+        await asyncio.sleep(0.05)
+        later = asyncio.ensure_future(dispatcher.call('chat_update', priority=PRIORITY_STATUS, tag='later'))
+        await asyncio.gather(first, later)
+        await dispatcher.close()
+        return client
+
+    client = run(scenario())
+    tags = [tag for _, tag, _ in client.calls]
+    assert tags == ['first', 'first', 'later']
+    # The later call waited out the pause instead of slipping in during it
+    assert client.times('chat_update', 'later')[0] >= client.times('chat_update', 'first')[1]